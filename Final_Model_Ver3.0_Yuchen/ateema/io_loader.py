@@ -1,18 +1,57 @@
 from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Dict, Tuple, Any
 import json
+import os
+import sys
+
+try:
+    import orjson  # optional C parser; falls back to stdlib json
+except ImportError:
+    orjson = None
 
 from .models import ProductRecord
+from .pricing import tier_order
 
 def _norm_duration_keys(dqm: dict | None) -> dict:
     if not dqm:
         return {}
+    if all(isinstance(k, str) and k.isupper() for k in dqm):
+        return dqm  # keys already upper-case; skip the copy
     out = {}
     for k, v in dqm.items():
         out[(str(k)).upper()] = v
     return out
 
+def read_json(p: str | Path) -> Any:
+    p = Path(p)
+    if orjson is not None:
+        return orjson.loads(p.read_bytes())
+    with open(p, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+_PRICE_MAP_KEYS = ("price_usd", "price_usd_by_plan", "pricing")
+
+def check_price_maps(opt: dict, source: Path) -> None:
+    """Reject non-numeric plan prices so pricing can skip per-value float() casts."""
+    for key in _PRICE_MAP_KEYS:
+        pm = opt.get(key)
+        if not isinstance(pm, dict):
+            continue
+        for plan, v in pm.items():
+            if isinstance(v, bool) or not isinstance(v, (int, float)):
+                raise ValueError(f"{source.name}: non-numeric {key}[{plan!r}] = {v!r} in option {opt.get('name')!r}")
+
+def folder_stamp(folder: str | Path) -> float:
+    # Changes when a product file is added, removed or edited; used as a cache key.
+    # Dotfiles are skipped, matching glob("*.json") in load_products.
+    try:
+        with os.scandir(folder) as it:
+            return max([os.stat(folder).st_mtime] + [e.stat().st_mtime for e in it if e.name.endswith(".json") and not e.name.startswith(".")])
+    except OSError:
+        return 0.0
+
 def load_products(path: Path) -> tuple[dict[str, ProductRecord], dict[str, dict]]:
     """Load product JSON files from a folder.
 
@@ -23,12 +62,21 @@ def load_products(path: Path) -> tuple[dict[str, ProductRecord], dict[str, dict]
     catalog: Dict[str, ProductRecord] = {}
     meta: Dict[str, dict] = {}
 
-    for p in sorted(path.glob("*.json")):
-        with open(p, "r", encoding="utf-8") as f:
-            data = json.load(f)
+    files = sorted(path.glob("*.json"))
+    # File reads overlap on a small thread pool; records are built in file order below.
+    with ThreadPoolExecutor(max_workers=min(16, len(files) or 1)) as ex:
+        datas = list(ex.map(read_json, files))
+
+    for p, data in zip(files, datas):
 
-        name = data.get("product_name") or data.get("name") or p.stem
+        # Interned, pre-stripped names make the pricing-side == checks cheap.
+        name = sys.intern(str(data.get("product_name") or data.get("name") or p.stem).strip())
         price_options = data.get("price_options") or data.get("options") or []
+        for opt in price_options:
+            if isinstance(opt.get("name"), str):
+                opt["name"] = sys.intern(opt["name"].strip())
+            check_price_maps(opt, p)
+            opt["_tier_order"] = tier_order(opt)
         cat = (
             data.get("category")
             or (data.get("categories")[0] if isinstance(data.get("categories"), list) and data.get("categories") else None)
@@ -67,7 +115,8 @@ def load_products(path: Path) -> tuple[dict[str, ProductRecord], dict[str, dict]
             "product_description": product_description,
             "sales_strategy": sales_strategy,
             "discount_policy": discount_policy,
-            "seasonal_price_windows": seasonal_price_windows
+            "seasonal_price_windows": seasonal_price_windows,
+            "_has_seasonal": bool(seasonal_price_windows),
         }
 
     return catalog, meta
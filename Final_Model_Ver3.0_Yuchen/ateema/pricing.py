@@ -1,4 +1,7 @@
 from __future__ import annotations
+import re
+from functools import lru_cache
+from operator import itemgetter
 from typing import Any, List, Tuple, Optional
 from datetime import date
 from .models import ProductRecord
@@ -28,6 +31,20 @@ NAMED_WINDOWS = {
     "Before Christmas": (1101, 1224),
 }
 
+# ================================================================
+# mmdd -> window label lookup table, indexed by month*100+day.
+# Exact windows are written last so they win over named ones on overlap.
+# ================================================================
+def _build_season_lut() -> tuple[str | None, ...]:
+    lut: list[str | None] = [None] * (12 * 100 + 31 + 1)
+    for windows in (NAMED_WINDOWS, EXACT_WINDOWS):
+        for label, (start, end) in windows.items():
+            for mmdd in range(start, end + 1):
+                lut[mmdd] = label
+    return tuple(lut)
+
+_SEASON_LUT = _build_season_lut()
+
 # ================================================================
 # Determine seasonal booth price
 # ================================================================
@@ -36,25 +53,65 @@ def booth_season_for_date(meta: dict, option_name: str, chosen_date: date) -> fl
     if not seasonal_map:
         return None
 
-    mmdd = _mmdd(chosen_date)
-
-    # 1) Exact windows first (always lowest)
-    for label, (start, end) in EXACT_WINDOWS.items():
-        if label in seasonal_map:
-            if start <= mmdd <= end:
-                return float(seasonal_map[label].get(option_name, None))
-
-    # 2) Named windows after exact windows
-    for label, (start, end) in NAMED_WINDOWS.items():
-        if label in seasonal_map:
-            if start <= mmdd <= end:
-                return float(seasonal_map[label].get(option_name, None))
-
-    return None
+    label = _SEASON_LUT[_mmdd(chosen_date)]
+    if label is None or label not in seasonal_map:
+        return None
+    return float(seasonal_map[label].get(option_name, None))
 
 # ================================================================
 # Existing helpers
 # ================================================================
+def _normalize(s: str | None) -> str:
+    return s.strip() if s else ""
+
+# Option dicts are loaded once and not mutated, so per-option results are
+# cached by identity. Each entry keeps a reference to the dict so its id
+# cannot be recycled while cached; callers must treat results as read-only.
+_OPT_CACHE_MAX = 4096
+
+def cached_by_option(fn):
+    """Memoize a one-argument function of an option dict by the dict's identity."""
+    cache: dict[int, tuple[dict, Any]] = {}
+
+    def wrapper(opt: dict):
+        hit = cache.get(id(opt))
+        if hit is not None and hit[0] is opt:
+            return hit[1]
+        out = fn(opt)
+        if len(cache) >= _OPT_CACHE_MAX:
+            cache.clear()
+        cache[id(opt)] = (opt, out)
+        return out
+
+    wrapper.__name__ = fn.__name__
+    wrapper.__doc__ = fn.__doc__
+    wrapper.cache_clear = cache.clear
+    return wrapper
+
+def to_cents(amount: float) -> int:
+    return int(round(amount * 100))
+
+_NUM_RE = re.compile(r"[\d.]+")
+
+def parse_tier_label(lbl: str) -> float:
+    """Numeric sort value of a tier label ("2X" -> 2.0); inf when there is none.
+
+    Every digit/dot in the label is joined, as in legacy/Dazhou/pricing.py.
+    """
+    try:
+        return float("".join(_NUM_RE.findall(lbl)))
+    except ValueError:
+        return float("inf")
+
+def tier_order(opt: dict) -> dict[str, float]:
+    order: dict[str, float] = {}
+    for key in ("price_usd", "price_usd_by_plan", "pricing"):
+        if isinstance(opt.get(key), dict):
+            for k in opt[key]:
+                order[str(k)] = parse_tier_label(str(k))
+    return order
+
+@cached_by_option
 def price_points(opt: dict) -> List[tuple[str, float]]:
     items = []
     if isinstance(opt.get("price_usd"), dict):
@@ -68,15 +125,12 @@ def price_points(opt: dict) -> List[tuple[str, float]]:
     else:
         items = []
 
-    def _key(lbl: str, price: float):
-        num = "".join(ch for ch in lbl if ch.isdigit() or ch == ".")
-        try:
-            x = float(num)
-        except:
-            x = float("inf")
-        return (x, price)
-
-    return sorted(items, key=lambda t: _key(t[0], t[1]))
+    # Label order is precomputed by load_products; parse on the fly otherwise.
+    order = opt.get("_tier_order")
+    if order is None:
+        order = tier_order(opt)
+    inf = float("inf")
+    return sorted(items, key=lambda it: (order.get(it[0], inf), it[1]))
 
 def option_min_budget(opt: dict) -> float:
     v = opt.get("target_budget_min")
@@ -121,20 +175,26 @@ def upgrade_candidates(product: ProductRecord, current: tuple[str, str, float] |
         for lbl, base_price in price_points(opt):
             line = effective_line_price(product, lbl, base_price)
             if line > cur_line:
-                cands.append((opt_name, lbl, base_price, min_budget))
+                cands.append((opt_name, lbl, base_price, min_budget, line))
 
-    cands.sort(key=lambda t: effective_line_price(product, t[1], t[2]))
-    return cands
+    # Sort on the line price computed above; callers get the usual 4-tuples
+    cands.sort(key=itemgetter(4))
+    return [c[:4] for c in cands]
 
 def first_known_price(opt: dict) -> float | None:
-    if isinstance(opt.get("price_usd"), dict):
-        return max(float(v) for v in opt["price_usd"].values())
-    if isinstance(opt.get("price_usd_by_plan"), dict):
-        return max(float(v) for v in opt["price_usd_by_plan"].values())
-    if isinstance(opt.get("price_usd"), (int, float)):
-        return float(opt["price_usd"])
-    if isinstance(opt.get("pricing"), dict):
-        return max(float(v) for v in opt["pricing"].values())
+    # Same precedence as before: price_usd map, plan map, flat price_usd, pricing map.
+    # max() runs on the raw values; only the winner is converted.
+    pu = opt.get("price_usd")
+    if isinstance(pu, dict):
+        return float(max(pu.values()))
+    plan = opt.get("price_usd_by_plan")
+    if isinstance(plan, dict):
+        return float(max(plan.values()))
+    if isinstance(pu, (int, float)):
+        return float(pu)
+    pricing = opt.get("pricing")
+    if isinstance(pricing, dict):
+        return float(max(pricing.values()))
     return None
 
 # ================================================================
@@ -146,8 +206,12 @@ def get_effective_unit_price(product_name: str,
                              meta: dict,
                              chosen_date: Optional[date],
                              is_advertiser: bool = False) -> float:
+    # Entry point: normalize names once; the helpers below take them as-is.
+    product_name = _normalize(product_name)
+    option_name = _normalize(option_name)
     eff = base_price
-    if chosen_date:
+    # load_products flags products without seasonal windows; other metas fall through
+    if chosen_date and meta.get("_has_seasonal", True):
         seasonal = booth_season_for_date(meta, option_name, chosen_date)
         if seasonal is not None:
             eff = seasonal
@@ -164,9 +228,42 @@ def get_effective_unit_price(product_name: str,
 
     return eff
 
+# ================================================================
+# Ambassador option prefix -> (retail, with-campaign) rates
+# ================================================================
+_AMBASSADOR_RATES = {
+    "Standard Ambassador Program": (3200.0, 2950.0),
+    "Ambassador - Concierge Intro": (3000.0, 2750.0),
+}
+_AMBASSADOR_RE = re.compile("|".join(map(re.escape, _AMBASSADOR_RATES)))
+
+def _ambassador_rates(opt: str) -> tuple[float, float] | None:
+    m = _AMBASSADOR_RE.match(opt)
+    return _AMBASSADOR_RATES[m.group()] if m else None
+
 # ================================================================
 # Advertiser-specific price overrides (Dazhou 11/17)
 # ================================================================
+@lru_cache(maxsize=2048)
+def _advertiser_override(name: str, opt: str) -> tuple[float | None, str | None]:
+    # Only the product/option names matter here, so results are cached on those.
+
+    # 1) Email Blast
+    if name == "Email Blast" and "Blast Email - concierge" in opt:
+        new_price = 450.0  # Contract with multiple products
+        label = "Existing advertiser contract rate"
+        return new_price, label
+
+    # 2) Ambassador Program: advertisers get the with-campaign rate
+    if name == "Ambassador Program":
+        rates = _ambassador_rates(opt)
+        if rates is not None:
+            label = "Existing advertiser – with any campaign rate"
+            return rates[1], label
+        return None,None
+
+    return None, None
+
 def advertiser_overrides(
     product_name: str,
     option_name: str,
@@ -185,41 +282,72 @@ def advertiser_overrides(
     if not is_advertiser:
         return None, None
 
-    name = (product_name or "").strip()
-    opt  = (option_name or "").strip()
+    return _advertiser_override((product_name or "").strip(), (option_name or "").strip())
 
-    # 1) Email Blast
-    if name == "Email Blast" and "Blast Email - concierge" in opt:
-            if is_advertiser:
-                new_price = 450.0  # Contract with multiple products
-                label = "Existing advertiser contract rate"
-                return new_price, label
-            return None, None
+advertiser_overrides.cache_clear = _advertiser_override.cache_clear
 
-    # 2) Ambassador Program 
-    if name == "Ambassador Program":
-        if not is_advertiser:
-            return None, None
-        
-        # Standard Ambassador Program
-        if opt.startswith("Standard Ambassador Program"):
-            new_price = 2950
-            label = "Existing advertiser – with any campaign rate"
-            return new_price, label
+# ================================================================
+# Discount Logic (unchanged) — one handler per product, dispatched by name
+# Handlers take (opt, tier, price, has_other_products, prepay_full_year,
+# billing_date) and return (final_price, label).
+# ================================================================
+def _hotel_meetup(opt, tier, price, has_other_products, prepay_full_year, billing_date):
+    # --- Hotel Meetup 2026 Early Bird ---
+    if billing_date is None or "Hotel Meetup 2026" not in opt:
+        return price, None
 
-        # Concierge Intro
-        if opt.startswith("Ambassador - Concierge Intro"):
-            new_price = 2750.0
-            label = "Existing advertiser – with any campaign rate"
-            return new_price, label
-        
-        return None,None
+    EARLY_BIRD_TEXT = "Early Bird Rate - Ends August 1"
+    RETAIL_PRICE = 2595.0
+    EARLY_BIRD_PRICE = 2395.0
 
-    return None, None
+    # 如果现在选的是 Early Bird 那一档
+    if EARLY_BIRD_TEXT in (tier or ""):
+        # 每年 8 月 1 日作为截止
+        deadline = date(billing_date.year, 8, 1)
+
+        if billing_date < deadline:
+            # ✅ 截止日前：允许用 Early Bird 2395
+            return EARLY_BIRD_PRICE, EARLY_BIRD_TEXT
+        else:
+            # ❌ 截止日后：不再允许 Early Bird，强制按 Retail 收 2595
+            return RETAIL_PRICE, None
+
+    # 如果 tier 不是 Early Bird（例如 Retail）：直接用 base_price
+    return price, None
+
+def _email_blast(opt, tier, price, has_other_products, prepay_full_year, billing_date):
+    if "Blast Email - concierge" in opt:
+        if has_other_products:
+            return 450.0, "Contract bundle price (with other products)"
+        return 750.0, None
+    return price, None
+
+def _reels(opt, tier, price, has_other_products, prepay_full_year, billing_date):
+    if has_other_products:
+        return 895.0, "With other purchase discount"
+    return 995.0, None
+
+def _ambassador(opt, tier, price, has_other_products, prepay_full_year, billing_date):
+    rates = _ambassador_rates(opt)
+    if rates is None:
+        return price, None
+    retail, with_campaign = rates
+    return (with_campaign, "With Any Campaign rate") if has_other_products else (retail, None)
+
+def _interactive_map(opt, tier, price, has_other_products, prepay_full_year, billing_date):
+    if prepay_full_year:
+        # 10% off in whole cents, rounded half-up
+        return (to_cents(price) * 9 + 5) // 10 / 100, "Prepay entire year – 10% off"
+    return price, None
+
+_DISCOUNT_HANDLERS = {
+    "Hotel Meetup": _hotel_meetup,
+    "Email Blast": _email_blast,
+    "Chicago Does Reels": _reels,
+    "Ambassador Program": _ambassador,
+    "Chicago Does Interactive Map": _interactive_map,
+}
 
-# ================================================================
-# Discount Logic (unchanged)
-# ================================================================
 def apply_discounts(
     product_name: str,
     option_name: str,
@@ -231,36 +359,9 @@ def apply_discounts(
     billing_date: date | None = None, # Add billing date as feature (Yuchen 11/18)
 ) -> tuple[float, str | None]:
 
-    name = (product_name or "").strip()
-    opt = (option_name or "").strip()
-    label = None
+    name = _normalize(product_name)
+    opt = _normalize(option_name)
     final_price = float(base_price)
-    # label: str | None = None
-    
-    # --- Hotel Meetup 2026 Early Bird ---
-    if (
-        billing_date is not None
-        and name == "Hotel Meetup"
-        and "Hotel Meetup 2026" in opt
-    ):
-        EARLY_BIRD_TEXT = "Early Bird Rate - Ends August 1"
-        RETAIL_PRICE = 2595.0
-        EARLY_BIRD_PRICE = 2395.0
-
-        # 如果现在选的是 Early Bird 那一档
-        if EARLY_BIRD_TEXT in (tier or ""):
-            # 每年 8 月 1 日作为截止
-            deadline = date(billing_date.year, 8, 1)
-
-            if billing_date < deadline:
-                # ✅ 截止日前：允许用 Early Bird 2395
-                return EARLY_BIRD_PRICE, EARLY_BIRD_TEXT
-            else:
-                # ❌ 截止日后：不再允许 Early Bird，强制按 Retail 收 2595
-                return RETAIL_PRICE, None
-
-        # 如果 tier 不是 Early Bird（例如 Retail）：直接用 base_price
-        return final_price, None
 
     # Check whether the product have advertiser discounts (Dazhou 11/17)
     adv_price, adv_label = advertiser_overrides(
@@ -272,33 +373,8 @@ def apply_discounts(
     )
     if adv_price is not None:
         return adv_price, adv_label
-    
-    if name == "Email Blast" and "Blast Email - concierge" in opt:
-        if has_other_products:
-            return 450.0, "Contract bundle price (with other products)"
-        return 750.0, None
 
-    if name == "Email Blast" and "Planner Eblast" in opt:
+    handler = _DISCOUNT_HANDLERS.get(name)
+    if handler is None:
         return final_price, None
-
-    if name == "Chicago Does Reels":
-        if has_other_products:
-            return 895.0, "With other purchase discount"
-        return 995.0, None
-
-    if name == "Ambassador Program":
-        if opt.startswith("Standard Ambassador Program"):
-            retail, with_campaign = 3200.0, 2950.0
-        elif opt.startswith("Ambassador - Concierge Intro"):
-            retail, with_campaign = 3000.0, 2750.0
-        else:
-            return final_price, None
-        return (with_campaign, "With Any Campaign rate") if has_other_products else (retail, None)
-
-    if name == "Chicago Does Interactive Map":
-        if prepay_full_year:
-            return round(base_price * 0.9, 2), "Prepay entire year – 10% off"
-        return final_price, None
-
-    return final_price, None
-
+    return handler(opt, tier, final_price, has_other_products, prepay_full_year, billing_date)
@@ -1,36 +1,40 @@
 
 from __future__ import annotations
-from copy import deepcopy
+from dataclasses import replace
 from typing import Dict
 from .models import ProductRecord
 
 def _contains_all(text: str, *keywords: str) -> bool:
-    t = (text or "").lower()
-    return all((k or "").lower() in t for k in keywords if k)
+    if not text:
+        return not any(keywords)  # nothing can match; only vacuously true
+    t = text.lower()
+    return all(k.lower() in t for k in keywords if k)
 
 def _contains_any(text: str, *keywords: str) -> bool:
-    t = (text or "").lower()
-    return any((k or "").lower() in t for k in keywords if k)
+    if not text:
+        return False
+    t = text.lower()
+    return any(k.lower() in t for k in keywords if k)
 
 def filter_summit_booth(rec: ProductRecord, profile_text: str, is_advertiser: bool) -> ProductRecord:
-    out = deepcopy(rec)
     name_l = (rec.name or '').lower()
     if "summit" not in name_l or "booth" not in name_l:
-        return out
+        return rec
 
-    txt = profile_text or ""
+    txt_l = (profile_text or "").lower()
     opts = rec.price_options or []
+    # Lower-case each option label once instead of on every comparison
+    opts_lower = [(o, (o.get("name","") or "").lower()) for o in opts]
+    # Profile lowered once; keywords are already lower-case literals
+    is_cvb = "cvb" in txt_l and "illinois" in txt_l
+    is_dmo = not is_cvb and ("dmo" in txt_l or "out-of-state" in txt_l or "out of state" in txt_l or "outside illinois" in txt_l)
 
-    def is_label(label: str, key: str) -> bool:
-        return (key or "").lower() in (label or "").lower()
+    # Only the filtered list is new; option dicts are shared with the catalog record
+    if is_cvb:
+        return replace(rec, price_options=[o for o, lo in opts_lower if "illinois cvb" in lo])
 
-    if _contains_all(txt, "cvb", "illinois"):
-        out.price_options = [o for o in opts if is_label(o.get("name",""), "Illinois CVB")]
-        return out
-
-    if _contains_any(txt, "dmo", "out-of-state", "out of state", "outside illinois"):
-        out.price_options = [o for o in opts if is_label(o.get("name",""), "DMO (out of Illinois)")]
-        return out
+    if is_dmo:
+        return replace(rec, price_options=[o for o, lo in opts_lower if "dmo (out of illinois)" in lo])
 
     # small business default
     if is_advertiser is True:
@@ -39,10 +43,10 @@ def filter_summit_booth(rec: ProductRecord, profile_text: str, is_advertiser: bo
         key = "Basic Booth — non-advertiser rate"
     else:
         key = "Basic Booth — advertiser rate"
-    out.price_options = [o for o in opts if o.get("name") == key]
-    if not out.price_options:
-        out.price_options = [o for o in opts if "basic booth" in (o.get("name","").lower())]
-    return out
+    filtered = [o for o in opts if o.get("name") == key]
+    if not filtered:
+        filtered = [o for o, lo in opts_lower if "basic booth" in lo]
+    return replace(rec, price_options=filtered)
 
 def apply_summit_rules(catalog: Dict[str, ProductRecord], profile_text: str, is_advertiser: bool) -> Dict[str, ProductRecord]:
     new = {}
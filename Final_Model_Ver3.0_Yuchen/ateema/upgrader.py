@@ -1,104 +1,142 @@
 from __future__ import annotations
 from typing import Dict, Tuple, Optional
 from datetime import date
+from bisect import bisect_right
 
 from ateema.pricing import (
     price_points,
     effective_line_price,
     get_effective_unit_price,
+    to_cents,
 )
 from ateema.models import Selection, ProductRecord
 
 import re
 
+# (opt_names, labels, eff_bases, lines), one entry per priced (option, tier)
+PriceColumns = Tuple[Tuple[str, ...], Tuple[str, ...], Tuple[float, ...], Tuple[float, ...]]
+
+def _allowed_summit_options(pname: str, product: ProductRecord, is_advertiser: bool) -> list[tuple[dict, str]]:
+    """(opt, opt_name) pairs the client may buy; shared by the baseline and upgrade passes."""
+    pname_low = pname.lower()
+    is_summit_booth = "summit" in pname_low and "booth" in pname_low
+    out = []
+    for opt in product.price_options:
+        opt_name = opt.get("name", pname)
+
+        # Dazhou 11/17 Advertiser: Summit Booth differentiate price of 
+        if is_summit_booth:
+            low = opt_name.lower()
+            has_non = ("non-advertiser" in low) or ("non advertiser" in low)
+            has_adv = ("advertiser" in low) and (not has_non)
+
+            if is_advertiser:
+                # 现有广告主：跳过非广告主专属价，其余都可以（含 generic）
+                if has_non:
+                    continue
+            else:
+                # 非广告主：跳过“纯 advertiser”专属价，保留 non-advertiser 和 generic
+                if has_adv:
+                    continue
+
+        out.append((opt, opt_name))
+    return out
+
+def build_price_table(products: Dict[str, ProductRecord],
+                      meta: Dict[str, dict],
+                      chosen_date: Optional[date],
+                      is_advertiser: bool = False) -> Dict[str, PriceColumns]:
+    """Price every allowed (option, tier) of each product once.
+
+    Returns product -> (opt_names, labels, eff_bases, lines), column-wise in
+    option/tier order, with seasonal pricing and advertiser overrides applied.
+    """
+    # Tiers of one option often share a unit price; memoize the seasonal/advertiser lookup for this call
+    eup_cache: Dict[tuple, float] = {}
+
+    def _eup(pname: str, opt_name: str, base_price: float) -> float:
+        k = (pname, opt_name, base_price)
+        v = eup_cache.get(k)
+        if v is None:
+            # apply seasonal price and advertiser override
+            v = get_effective_unit_price(pname, opt_name, base_price, meta.get(pname, {}), chosen_date,is_advertiser=is_advertiser,) # Dazhou 11/17 Advertiser
+            eup_cache[k] = v
+        return v
+
+    table: Dict[str, PriceColumns] = {}
+    for pname, product in products.items():
+        opt_names, labels, eff_bases, lines = [], [], [], []
+        # Advertiser filter applied once per product
+        for opt, opt_name in _allowed_summit_options(pname, product, is_advertiser):
+            for lbl, base_price in price_points(opt):
+                eff_base = _eup(pname, opt_name, base_price)
+                opt_names.append(opt_name)
+                labels.append(lbl)
+                eff_bases.append(eff_base)
+                lines.append(effective_line_price(product, lbl, eff_base))
+        table[pname] = (tuple(opt_names), tuple(labels), tuple(eff_bases), tuple(lines))
+    return table
+
 def greedy_fill_to_cap(budget: float,
                        products: Dict[str, ProductRecord],
                        meta: Dict[str, dict],
                        chosen_date: Optional[date],
                        is_advertiser: bool = False) -> Selection:
-    picks = {}
-    subtotal = 0.0
-
-    # baseline picks
-    for pname, product in products.items():
-        best = None
-        best_line = None
-        for opt in product.price_options:
-            opt_name = opt.get("name", pname)
-
-             # Dazhou 11/17 Advertiser: Summit Booth differentiate price of 
-            if "summit" in pname.lower() and "booth" in pname.lower():
-                low = opt_name.lower()
-                has_non = ("non-advertiser" in low) or ("non advertiser" in low)
-                has_adv = ("advertiser" in low) and (not has_non)
-
-                if is_advertiser:
-                    # 现有广告主：跳过非广告主专属价，其余都可以（含 generic）
-                    if has_non:
-                        continue
-                else:
-                    # 非广告主：跳过“纯 advertiser”专属价，保留 non-advertiser 和 generic
-                    if has_adv:
-                        continue
-
-            for lbl, base_price in price_points(opt):
-                # apply seasonal price and advertiser override
-                eff_base = get_effective_unit_price(pname, opt_name, base_price, meta.get(pname, {}), chosen_date,is_advertiser=is_advertiser,) # Dazhou 11/17 Advertiser
-                line = effective_line_price(product, lbl, eff_base)
-                
-                
-                if best is None or line < best_line:
-                    best = (opt_name, lbl, eff_base)
-                    best_line = line
-
-        if best:
-            opt_name, lbl, eff_base = best
-            subtotal += effective_line_price(product, lbl, eff_base)
-            picks[pname] = (opt_name, lbl, eff_base)
-
-    # upgrade loop
+    # Running total and budget in integer cents so the cap check is exact
+    subtotal = 0
+    budget_c = to_cents(budget)
+
+    table = build_price_table(products, meta, chosen_date, is_advertiser)
+
+    # Picked products as parallel lists, indexed by position in `names`
+    names: list[str] = []
+    cols: list[PriceColumns] = []
+    pick: list[int] = []          # chosen cell index per product
+    cur_line: list[int] = []      # chosen line in cents per product
+    order: list[list[int]] = []   # cell indices, stably sorted by line cents
+    sorted_lines: list[list[int]] = []  # line cents in that order
+
+    # baseline picks: first cheapest cell in option/tier order
+    for pname, c in table.items():
+        lines = c[3]
+        if not lines:
+            continue
+        cents = [to_cents(x) for x in lines]
+        best = min(range(len(lines)), key=lines.__getitem__)
+        subtotal += cents[best]
+        # stable sort: equal lines keep option/tier order, as the old per-round sort did
+        o = sorted(range(len(cents)), key=cents.__getitem__)
+        names.append(pname)
+        cols.append(c)
+        pick.append(best)
+        cur_line.append(cents[best])
+        order.append(o)
+        sorted_lines.append([cents[i] for i in o])
+
+    # upgrade loop: the next step up is the first cell priced above the current line
     improved = True
     while improved:
         improved = False
-        for pname, (cur_opt, cur_lbl, cur_base) in list(picks.items()):
-            product = products[pname]
-            cur_line = effective_line_price(product, cur_lbl, cur_base)
-
-            upgrades = []
-            for opt in product.price_options:
-                opt_name = opt.get("name", pname)
-
-                # Keep the filter of advertiser/non-advertiser 
-                if "summit" in pname.lower() and "booth" in pname.lower():
-                    low = opt_name.lower()
-                    has_non = ("non-advertiser" in low) or ("non advertiser" in low)
-                    has_adv = ("advertiser" in low) and (not has_non)
-
-                    if is_advertiser:
-                        # 现有广告主：跳过非广告主专属价，其余都可以（含 generic）
-                        if has_non:
-                            continue
-                    else:
-                        # 非广告主：跳过“纯 advertiser”专属价，保留 non-advertiser 和 generic
-                        if has_adv:
-                            continue
-
-                for lbl, base_price in price_points(opt):
-                    eff_base = get_effective_unit_price(pname, opt_name, base_price, meta.get(pname, {}), chosen_date,is_advertiser=is_advertiser,) # Dazhou 11/17 Advertiser
-                    line = effective_line_price(product, lbl, eff_base)
-                    if line > cur_line:
-                        upgrades.append((opt_name, lbl, eff_base, line))
-
-            upgrades.sort(key=lambda x: x[3])
-
-            for opt_name, lbl, eff_base, new_line in upgrades:
-                if subtotal - cur_line + new_line <= budget:
-                    subtotal = subtotal - cur_line + new_line
-                    picks[pname] = (opt_name, lbl, eff_base)
-                    improved = True
-                    break
-
-    return Selection(picks=picks, subtotal=round(subtotal, 2))
+        for k in range(len(names)):
+            cur = cur_line[k]
+            sl = sorted_lines[k]
+            i = bisect_right(sl, cur)
+            if i == len(sl):
+                continue
+            # cells are ascending: if the cheapest step up does not fit, none will
+            new_line = sl[i]
+            if subtotal - cur + new_line <= budget_c:
+                subtotal = subtotal - cur + new_line
+                pick[k] = order[k][i]
+                cur_line[k] = new_line
+                improved = True
+
+    picks = {}
+    for k, pname in enumerate(names):
+        opt_names, labels, eff_bases, _ = cols[k]
+        j = pick[k]
+        picks[pname] = (opt_names[j], labels[j], eff_bases[j])
+    return Selection(picks=picks, subtotal=subtotal / 100)
 
 
 def run_fill_to_cap(total_budget: float,
@@ -1,5 +1,5 @@
-from datetime import datetime
 from __future__ import annotations
+from datetime import date
 from pathlib import Path
 import argparse
 
@@ -24,7 +24,7 @@ def main():
     chosen_date = None
     if args.billing_date:
         try:
-            chosen_date = datetime.strptime(args.billing_date, "%Y-%m-%d").date()
+            chosen_date = date.fromisoformat(args.billing_date)
         except Exception:
             print("Invalid --billing-date format. Use YYYY-MM-DD.")
 
@@ -60,4 +60,10 @@ RULES:
 - Keep total <= ${budget_cap}. Prefer totals close to the cap without exceeding it.
 - Reflect the budget split: favor conversion-oriented selections for Immediate Impact % and reach/awareness items for Brand Awareness %.
 - Do not invent facts. Cite only phrases present in the Product Descriptions / Sales Strategy / Discount Policy.
-""")
\ No newline at end of file
+""")
+
+# Raw template string; lets hot paths skip LangChain's per-call variable scan.
+_PROMPT_STR = PROPOSAL_PROMPT.template
+
+def render_proposal(**kw) -> str:
+    return _PROMPT_STR.format_map(kw)
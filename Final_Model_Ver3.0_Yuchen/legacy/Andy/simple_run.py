@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import argparse, json, re, string, datetime
+from operator import attrgetter
 from pathlib import Path
 from typing import Dict, Tuple, List, Any
 
@@ -9,20 +10,23 @@ from langchain_ollama import OllamaLLM
 from langchain_core.output_parsers import StrOutputParser
 
 from simple_schemas import InputPayload, ProductRecord, Proposal
-from simple_prompt import PROPOSAL_PROMPT
+from simple_prompt import render_proposal
 
 # ---------- helpers ----------
+_FENCE_RE = re.compile(r"^```(?:json)?\s*|\s*```$", re.IGNORECASE | re.DOTALL)
+_CTRL_RE = re.compile(r"[\x00-\x1F]+")
+
 def read_json(p: Path) -> Any:
     return json.loads(p.read_text(encoding="utf-8"))
 
 def load_input(path: Path) -> InputPayload:
     return InputPayload(**read_json(path))
 
+_CANON_TRANS = str.maketrans("", "", string.punctuation + " ")
+
 def _canonical(s: str) -> str:
     """lowercase, remove spaces/punct, drop the word 'does', singularize trailing 's'."""
-    t = s.lower()
-    for ch in string.punctuation + " ":
-        t = t.replace(ch, "")
+    t = s.lower().translate(_CANON_TRANS)
     t = t.replace("does", "")  # project-specific normalization
     if t.endswith("s"):
         t = t[:-1]
@@ -44,8 +48,11 @@ def load_products(dir_path: Path) -> Dict[str, ProductRecord]:
         out[name] = rec
     return out
 
-def ensure_candidates(candidates: List[str], products: Dict[str, ProductRecord]) -> Tuple[List[str], List[str], Dict[str,str]]:
-    index = { _canonical(n): n for n in products.keys() }
+def canonical_index(products: Dict[str, ProductRecord]) -> Dict[str, str]:
+    """Canonical name -> REAL product name; build once per product load."""
+    return { _canonical(n): n for n in products.keys() }
+
+def ensure_candidates(candidates: List[str], index: Dict[str, str]) -> Tuple[List[str], List[str], Dict[str,str]]:
     present_real: List[str] = []
     missing_orig: List[str] = []
     mapping: Dict[str, str] = {}
@@ -139,7 +146,8 @@ def main():
 
     inp = load_input(Path(args.input))
     all_products = load_products(Path(args.products))
-    present_real, missing_orig, name_map = ensure_candidates(inp.candidate_products, all_products)
+    products_index = canonical_index(all_products)
+    present_real, missing_orig, name_map = ensure_candidates(inp.candidate_products, products_index)
     if not present_real:
         raise SystemExit("No candidate products matched. Check names or normalization.")
 
@@ -151,7 +159,7 @@ def main():
 
     # warm, straightforward call
     llm = OllamaLLM(model=args.model, temperature=args.temperature)
-    prompt_str = PROPOSAL_PROMPT.format(
+    prompt_str = render_proposal(
         profile=inp.client_profile,
         budget=inp.budget,
         budget_cap=cap,
@@ -168,9 +176,9 @@ def main():
     try:
         data = json.loads(raw)
     except Exception:
-        cleaned = re.sub(r"^```(?:json)?\s*|\s*```$", "", raw.strip(), flags=re.IGNORECASE | re.DOTALL)
+        cleaned = _FENCE_RE.sub("", raw.strip())
         # replace unescaped control characters (bad newlines/tabs inside strings)
-        cleaned = re.sub(r'[\x00-\x1F]+', ' ', cleaned)
+        cleaned = _CTRL_RE.sub(" ", cleaned)
         # ensure backslashes and quotes are balanced
         cleaned = cleaned.replace('\\n', ' ').replace('\\t', ' ').replace('\r', ' ')
         try:
@@ -185,11 +193,18 @@ def main():
 
     # Enforce soft cap as a safety net
     if prop.subtotal is not None and prop.subtotal > cap:
-        prop.selections.sort(key=lambda s: float(s.line_total or 0), reverse=True)
-        removed = []
-        while len(prop.selections) > 1 and sum(float(s.line_total or 0) for s in prop.selections) > cap:
-            removed.append(prop.selections.pop(0))
-        prop = Proposal(**prop.model_dump())
+        sels = prop.selections
+        # line_total is always a float here: Selection's validator fills it in
+        sels.sort(key=attrgetter("line_total"), reverse=True)
+        # Drop largest-first with a running total; one slice delete instead of repeated pop(0)
+        total = sum(s.line_total for s in sels)
+        k = 0
+        while len(sels) - k > 1 and total > cap:
+            total -= sels[k].line_total
+            k += 1
+        removed = sels[:k]
+        del sels[:k]
+        prop.refresh_subtotal()  # selections are already validated
         removed_list = ", ".join(f"{r.product_name} (${r.line_total})" for r in removed) or "none"
         note = f"Soft cap enforced at ${cap} (budget ${inp.budget} + {int(args.soft_cap_pct*100)}%). Removed: {removed_list}. Final subtotal: ${prop.subtotal}."
         prop.notes = (prop.notes + " " if prop.notes else "") + note
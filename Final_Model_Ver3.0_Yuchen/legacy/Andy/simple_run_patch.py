@@ -1,23 +1,22 @@
 
-from dataclasses import dataclass
 from pathlib import Path
 from typing import Any, Dict, List, Tuple
 import json
+import sys
 import argparse
-from dataclasses import asdict
 
-def read_json(path: Path) -> dict:
-    with open(path, "r", encoding="utf-8") as f:
-        return json.load(f)
+# Direct runs (python legacy/Andy/simple_run_patch.py) only put this folder on
+# sys.path; add the project root so the ateema package resolves as with -m.
+_PROJECT_ROOT = str(Path(__file__).resolve().parents[2])
+if _PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, _PROJECT_ROOT)
 
-
-@dataclass
-class ProductRecord:
-    name: str
-    price_options: List[Dict[str, Any]]
-    discount_policy: Any = None
-    sales_strategy: Any = None
-    description: str = ""
+# Shared definitions live in the ateema package; this script only keeps its own
+# loader (different meta shape) and the prompt-preview formatting.
+from ateema.models import ProductRecord
+from ateema.catalog import partition_by_category
+from ateema.budget import print_pool_audit
+from ateema.io_loader import check_price_maps, read_json
 
 
 def load_products(dir_path: Path) -> Tuple[Dict[str, ProductRecord], Dict[str, dict]]:
@@ -26,99 +25,49 @@ def load_products(dir_path: Path) -> Tuple[Dict[str, ProductRecord], Dict[str, d
 
     for p in sorted(dir_path.glob("*.json")):
         obj = read_json(p)
-        name = obj.get("name") or obj.get("product_name") or obj.get("product_id") or p.stem
+        get = obj.get
+        name = sys.intern(str(get("name") or get("product_name") or get("product_id") or p.stem).strip())
+        price_options = get("price_options", get("options", [])) or []
+        for opt in price_options:
+            if isinstance(opt, dict) and isinstance(opt.get("name"), str):
+                opt["name"] = sys.intern(opt["name"].strip())
+            if isinstance(opt, dict):
+                check_price_maps(opt, p)
 
         rec = ProductRecord(
             name=name,
-            price_options=obj.get("price_options", obj.get("options", [])) or [],
-            discount_policy=obj.get("discount_policy"),
-            sales_strategy=obj.get("sales_strategy"),
-            description=obj.get("product_description") or obj.get("description") or "",
+            price_options=price_options,
+            discount_policy=get("discount_policy"),
+            sales_strategy=get("sales_strategy"),
+            product_description=get("product_description") or get("description") or "",
         )
         out[name] = rec
 
-        dur = obj.get("duration_quarter_map") or {}
-        dur_up = { (k.upper() if isinstance(k, str) else k): v for k, v in dur.items() }
+        dur = get("duration_quarter_map")
+        if not dur:
+            dur_up = {}
+        elif all(isinstance(k, str) and k.isupper() for k in dur):
+            dur_up = dur  # already upper-cased (the usual case): reuse as-is
+        else:
+            dur_up = { (k.upper() if isinstance(k, str) else k): v for k, v in dur.items() }
 
         meta[name] = {
-            "category": obj.get("category"),
-            "billing_period": obj.get("billing_period"),
+            "category": get("category"),
+            "billing_period": get("billing_period"),
             "duration_quarter_map": dur_up,
         }
 
     return out, meta
 
 
-def normalize_category(raw: str | None) -> str | None:
-    if not raw:
-        return None
-    r = raw.strip().lower()
-    if "tourist" in r:
-        return "tourist"
-    if "industry" in r:
-        return "industry"
-    return r  # fallback
-
-@dataclass
-class PoolInfo:
-    label: str
-    budget: float
-    subtotal: float = 0.0
-    items: List[str] = None
-
-    def __post_init__(self):
-        if self.items is None:
-            self.items = []
-
-def partition_by_category(catalog: Dict[str, ProductRecord], meta: Dict[str, dict]) -> Tuple[Dict[str, ProductRecord], Dict[str, ProductRecord]]:
-    tourist, industry = {}, {}
-    for name, rec in catalog.items():
-        cat = normalize_category((meta.get(name) or {}).get("category"))
-        if cat == "tourist":
-            tourist[name] = rec
-        elif cat == "industry":
-            industry[name] = rec
-        # else: ignore/misc bucket for now
-    return tourist, industry
-
-def compute_pools(total_budget: float, tourist_pct: float, industry_pct: float) -> Tuple[PoolInfo, PoolInfo]:
-    # permissive rounding to keep cents out of the way
-    t_budget = round(total_budget * (tourist_pct / 100.0), 2)
-    i_budget = round(total_budget * (industry_pct / 100.0), 2)
-    return PoolInfo("tourist", t_budget), PoolInfo("industry", i_budget)
-
-def print_pool_audit(total_budget: float, tourist_pct: float, industry_pct: float,
-                     t_set: Dict[str, ProductRecord], i_set: Dict[str, ProductRecord]) -> None:
-    t_pool, i_pool = compute_pools(total_budget, tourist_pct, industry_pct)
-    print("\n=== Focus Split & Pools ===")
-    print(f"Total budget: ${total_budget:,.0f} | split: {tourist_pct:.1f}% tourist / {industry_pct:.1f}% industry")
-    print(f"Tourist pool:  ${t_pool.budget:,.0f}  | {len(t_set)} products: {', '.join(t_set.keys()) or '—'}")
-    print(f"Industry pool: ${i_pool.budget:,.0f}  | {len(i_set)} products: {', '.join(i_set.keys()) or '—'}")
-    # Acceptance target example for 45k/60-40
-    soft_example = (total_budget == 45000 and abs(tourist_pct - 60) < 1e-6)
-    if soft_example:
-        print("Acceptance guidance: spend ≥ $27k tourist and ≥ $18k industry unless pool is capped by available SKUs.")
-
-# OPTIONAL: a unified price accessor for later steps (fill-to-cap etc.)
-def first_known_price(opt: Dict[str, Any]) -> float | None:
-    """
-    Returns a representative price from an option for auditing or simple heuristics.
-    Handles both {'price_usd': {plan: price}} and {'price_usd_by_plan': {...}} and {'price_usd': number}.
-    """
-    if isinstance(opt.get("price_usd"), dict):
-        # pick the priciest plan as a conservative estimate
-        return max(opt["price_usd"].values())
-    if isinstance(opt.get("price_usd_by_plan"), dict):
-        return max(opt["price_usd_by_plan"].values())
-    if isinstance(opt.get("price_usd"), (int, float)):
-        return float(opt["price_usd"])
-    if isinstance(opt.get("pricing"), dict):
-        return max(opt["pricing"].values())
-    return None
+_MONEY_FMT = "${:,.0f}".format
 
 def _fmt_money(v: Any) -> str:
+    # Plan-price maps are numeric-checked at load, so the common case is a plain number
+    if type(v) is float or type(v) is int:
+        return _MONEY_FMT(v)
     try:
-        return f"${float(v):,.0f}"
+        return _MONEY_FMT(float(v))
     except Exception:
         return str(v)
 
@@ -198,8 +147,8 @@ def format_product_block(products: Dict[str, ProductRecord], meta: Dict[str, dic
 def format_descriptions_block(products: Dict[str, ProductRecord]) -> str:
     parts = []
     for name, rec in products.items():
-        if rec.description:
-            parts.append(f"### {name}\n{rec.description}")
+        if rec.product_description:
+            parts.append(f"### {name}\n{rec.product_description}")
     return "\n\n".join(parts)
 
 
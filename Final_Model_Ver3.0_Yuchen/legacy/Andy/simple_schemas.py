@@ -1,6 +1,7 @@
 from __future__ import annotations
+import math
 from typing import List, Optional, Dict, Any
-from pydantic import BaseModel, Field, model_validator
+from pydantic import BaseModel, ConfigDict, Field, model_validator
 
 # ===== Inputs =====
 class SimilarClient(BaseModel):
@@ -32,10 +33,14 @@ class Selection(BaseModel):
     line_total: Optional[float] = Field(default=None, ge=0)
     reasoning: str  # ask the model for 3–5 sentences using the new context
 
+    # Validators run once at construction; attribute writes are not re-validated
+    model_config = ConfigDict(validate_assignment=False)
+
     @model_validator(mode="after")
     def compute_line_total(self):
-        expected = round(float(self.unit_price) * int(self.qty), 2)
-        if self.line_total is None or abs(float(self.line_total) - expected) > 0.01:
+        # unit_price/qty are already coerced to float/int by the field types
+        expected = round(self.unit_price * self.qty, 2)
+        if self.line_total is None or abs(self.line_total - expected) > 0.01:
             self.line_total = expected
         return self
 
@@ -47,7 +52,14 @@ class Proposal(BaseModel):
     subtotal: Optional[float] = Field(default=None, ge=0)
     notes: Optional[str] = None
 
+    model_config = ConfigDict(validate_assignment=False)
+
     @model_validator(mode="after")
     def compute_subtotal(self):
-        self.subtotal = round(sum(float(s.line_total or 0) for s in self.selections), 2)
+        self.refresh_subtotal()
         return self
+
+    def refresh_subtotal(self) -> None:
+        """Recompute subtotal after editing `selections` in place (no re-validation)."""
+        # line_total is always set by Selection's validator; fsum avoids accumulated FP error
+        self.subtotal = round(math.fsum(s.line_total for s in self.selections if s.line_total), 2)
@@ -1,12 +1,12 @@
 
 from __future__ import annotations
-import json
+import os
 import re
 from pathlib import Path
 from typing import Dict, List
 import streamlit as st
 
-from ateema.io_loader import load_products
+from ateema.io_loader import folder_stamp, load_products, read_json
 from ateema.summit_rules import apply_summit_rules
 from ateema.catalog import partition_by_category
 from ateema.upgrader import run_fill_to_cap
@@ -16,6 +16,18 @@ from ateema.formatting import format_product_block
 st.set_page_config(page_title="Ateema – Proposal Builder", page_icon="🧭", layout="wide")
 st.title("Ateema – Proposal Builder")
 
+# Table styling, injected once per page rather than once per rendered table
+st.markdown(
+    """
+    <style>
+    table { table-layout: fixed; width: 100%; border-collapse: collapse; }
+    thead th { font-weight: 700; font-size: 16px !important; text-align: left; padding: 6px; }
+    td { white-space: normal !important; word-wrap: break-word !important; font-size: 15px; vertical-align: top; padding: 6px; }
+    </style>
+    """,
+    unsafe_allow_html=True,
+)
+
 # ---------- Sidebar (old layout restored) ----------
 DEFAULT_PRODUCTS = r"C:\Users\fanmu\PycharmProjects\AteemaRag\Data\PriceStrategy"
 with st.sidebar:
@@ -28,31 +40,41 @@ with st.sidebar:
     soft_cap_pct = st.slider("Soft cap (+%)", 0, 50, 10, 1)
 
 # ---------- Utils ----------
+_QTY_RE = re.compile(r"(\d+)\s*[xX]")
+_FOCUS_RE = re.compile(r"Focus:\s*(.*)", re.IGNORECASE)
+_TARGET_RE = re.compile(r"Market Target:\s*(.*)", re.IGNORECASE)
+
 def list_jsons(folder: Path) -> List[str]:
+    # scandir entries carry the file type from the directory read; no Path per match
     try:
-        return sorted([str(p) for p in folder.glob("*.json")])
+        with os.scandir(folder) as it:
+            # glob("*.json") skipped dotfiles; keep that
+            return sorted(e.path for e in it if e.name.endswith(".json") and not e.name.startswith(".") and e.is_file())
     except Exception:
         return []
 
+@st.cache_data(show_spinner=False)
+def _list_jsons_cached(folder: str, stamp: float) -> List[str]:
+    return list_jsons(Path(folder))
+
+@st.cache_data(show_spinner=False)
+def _load_catalog_cached(folder: str, stamp: float):
+    return load_products(Path(folder))
+
 def qty_from_tier(tier: str) -> int:
     if not tier:
         return 1
-    m = re.fullmatch(r"(\d+)\s*[xX]", tier.strip())
+    m = _QTY_RE.fullmatch(tier.strip())
     return int(m.group(1)) if m else 1
 
-def make_reasoning(product_name: str, option: str, tier: str, pool_label: str,
-                   focus: str, market_target: str) -> str:
-    bits = []
-    bits.append(f"{product_name} – selected '{option}'{(' at ' + tier) if tier and tier.lower()!='base' else ''} for the {pool_label} pool.")
-    if focus:
-        bits.append(f"Aligns with focus: {focus.strip()}.")
-    if market_target:
-        bits.append(f"Reaches: {market_target.strip()}.")
-    return " ".join(bits[:3])
+def parse_profile_fields(profile_text: str) -> Dict[str, str]:
+    """"Key: value" lines of a profile, parsed once (e.g. "Business Name", "Focus")."""
+    return {k.strip(): v.strip() for k, v in (line.split(":", 1) for line in profile_text.splitlines() if ":" in line)}
 
 def rows_from_selection(label: str, sel, focus: str, market_target: str,
-                        meta_map: Dict[str, dict]) -> List[Dict]:
-    out = []
+                        meta_map: Dict[str, dict]) -> Dict[str, list]:
+    """Column lists (one entry per pick) so the table frame is built without per-row dict inference."""
+    products, options, qtys, unit_prices, reasonings, policies = [], [], [], [], [], []
     for prod, (opt_name, tier, unit_price) in sel.picks.items():
         m = meta_map.get(prod, {}) or {}
         notes_map = m.get("notes_map", {}) or {}
@@ -74,20 +96,21 @@ def rows_from_selection(label: str, sel, focus: str, market_target: str,
         if market_target:
             bits.append(f"Reaches: {market_target.strip()}.")
 
-        reasoning = " ".join([b for b in bits if b][:3])  # keep concise, first 2–3
-
-        qty = qty_from_tier(tier)
-        line_total = unit_price * qty
-        out.append({
-            "product": prod,
-            "option": opt_name,
-            "qty": qty,
-            "unit_price": unit_price,
-            "total_price": line_total,
-            "reasoning": reasoning,
-            "discount_policy": _short_policy_text(m.get("discount_policy")),  # NEW column
-        })
-    return out
+        products.append(prod)
+        options.append(opt_name)
+        qtys.append(qty_from_tier(tier))
+        unit_prices.append(unit_price)
+        reasonings.append(" ".join([b for b in bits if b][:3]))  # keep concise, first 2–3
+        policies.append(_short_policy_text(m.get("discount_policy")))  # NEW column
+
+    return {
+        "product": products,
+        "option": options,
+        "qty": qtys,
+        "unit_price": unit_prices,
+        "reasoning": reasonings,
+        "discount_policy": policies,
+    }
 
 def _short_policy_text(policy) -> str:
     # Accepts str or dict; returns a single-line summary
@@ -110,7 +133,8 @@ if not folder.exists():
     st.error(f"Folder not found: {products_path}")
     st.stop()
 
-found = list_jsons(folder)
+stamp = folder_stamp(folder)
+found = _list_jsons_cached(str(folder), stamp)
 if not found:
     st.warning("No *.json files found in the selected folder.")
 else:
@@ -121,12 +145,12 @@ else:
 catalog = {}
 meta = {}
 try:
-    catalog, meta = load_products(folder)
+    catalog, meta = _load_catalog_cached(str(folder), stamp)
 except Exception as e:
     bad = None
     for p in folder.glob("*.json"):
         try:
-            _ = json.loads(Path(p).read_text(encoding="utf-8"))
+            _ = read_json(Path(p))
         except Exception as sub_e:
             bad = (str(p), str(sub_e))
             break
@@ -152,15 +176,15 @@ if input_mode == "Load JSON":
     st.subheader("Load JSON")
     json_path = st.text_input("Input JSON path", value=str(Path(folder.parent, "Inputs", "input.json")))
     if st.button("Generate Proposal", type="primary", key="gen_from_json"):
-        raw = json.loads(Path(json_path).read_text(encoding="utf-8"))
+        raw = read_json(Path(json_path))
         profile = raw.get("client_profile", "")
         total_budget = float(raw.get("budget", 0))
         similar_clients = raw.get("similar_clients", [])
         chosen = list(raw.get("candidate_products", []))
 
         # Extract focus/target from profile for reasoning
-        focus_match = re.search(r"Focus:\s*(.*)", profile, re.IGNORECASE)
-        target_match = re.search(r"Market Target:\s*(.*)", profile, re.IGNORECASE)
+        focus_match = _FOCUS_RE.search(profile)
+        target_match = _TARGET_RE.search(profile)
         focus_text = focus_match.group(1).strip() if focus_match else ""
         market_text = target_match.group(1).strip() if target_match else ""
         profile_text = profile
@@ -231,25 +255,30 @@ else:
         st.session_state["_trigger_generate"] = True
 
 # ---------- Output helpers ----------
-def _render_table(label: str, sel):
+def _table_df(label: str, sel, meta_map: Dict[str, dict]):
+    import numpy as np
     import pandas as pd
-    rows = rows_from_selection(label, sel, focus_text, market_text)
-    if rows:
-        st.write(f"**Subtotal:** ${sel.subtotal:,.0f}")
-        df = pd.DataFrame(rows, columns=["product", "option", "qty", "unit_price", "total_price", "reasoning"])
-        st.markdown(
-            """
-            <style>
-            table { table-layout: fixed; width: 100%; border-collapse: collapse; }
-            thead th { font-weight: 700; font-size: 16px !important; text-align: left; padding: 6px; }
-            td { white-space: normal !important; word-wrap: break-word !important; font-size: 15px; vertical-align: top; padding: 6px; }
-            </style>
-            """,
-            unsafe_allow_html=True,
-        )
-        st.table(df)
-    else:
+    cols = rows_from_selection(label, sel, focus_text, market_text, meta_map)
+    if not cols["product"]:
+        return None
+    qty = np.asarray(cols["qty"], dtype=np.int32)
+    unit_price = np.asarray(cols["unit_price"], dtype=np.float64)
+    # Typed columns: pandas takes the arrays as-is instead of inferring per row
+    return pd.DataFrame({
+        "product": cols["product"],
+        "option": cols["option"],
+        "qty": qty,
+        "unit_price": unit_price,
+        "total_price": unit_price * qty,
+        "reasoning": cols["reasoning"],
+    }, copy=False)
+
+def _render_table(sel, df):
+    if df is None:
         st.info("No items selected.")
+        return
+    st.markdown(f"**Subtotal:** ${sel.subtotal:,.0f}")
+    st.table(df)
 
 # ---------- Generation ----------
 if st.session_state.get("_trigger_generate"):
@@ -258,29 +287,44 @@ if st.session_state.get("_trigger_generate"):
         st.warning("Select at least one product.")
         st.stop()
 
-    subset = {k: catalog[k] for k in chosen if k in catalog}
-    subset = apply_summit_rules(subset, profile_text=profile_text, is_advertiser=is_advertiser)
-
-    t_set, i_set = partition_by_category(subset, {k: meta.get(k, {}) for k in subset.keys()})
-    t_sel, i_sel, grand_total = run_fill_to_cap(total_budget, tourist_pct, industry_pct, t_set, i_set)
-
-    # header
-    st.markdown(f"### {profile_text.splitlines()[0].replace('Business Name:','').strip() or 'Client'}")
+    # Same inputs (and unchanged product folder) as the last run: reuse its allocation
+    inputs_key = hash((str(folder), stamp, tuple(chosen), profile_text, is_advertiser,
+                       total_budget, tourist_pct, industry_pct))
+    if st.session_state.get("_last_inputs_hash") == inputs_key:
+        subset, meta_subset, t_sel, i_sel, grand_total = st.session_state["_last_result"]
+    else:
+        subset = {k: catalog[k] for k in chosen if k in catalog}
+        subset = apply_summit_rules(subset, profile_text=profile_text, is_advertiser=is_advertiser)
+        # Built once; shared by partitioning, pricing, the tables and the preview
+        meta_subset = {k: meta.get(k, {}) for k in subset}
+
+        t_set, i_set = partition_by_category(subset, meta_subset)
+        t_sel, i_sel, grand_total = run_fill_to_cap(total_budget, tourist_pct, industry_pct, t_set, i_set, meta_subset, is_advertiser=is_advertiser)
+        st.session_state["_last_inputs_hash"] = inputs_key
+        st.session_state["_last_result"] = (subset, meta_subset, t_sel, i_sel, grand_total)
+
+    # Build everything first, then emit: one markdown block for the header
+    t_df = _table_df("tourist", t_sel, meta_subset)
+    i_df = _table_df("industry", i_sel, meta_subset)
+
+    profile_fields = parse_profile_fields(profile_text)
+    client_title = profile_fields.get("Business Name") or (profile_text.splitlines() or [""])[0].strip() or "Client"
+    header = [f"### {client_title}"]
     if focus_text:
-        st.write(f"**Focus:** {focus_text}")
+        header.append(f"**Focus:** {focus_text}")
     if market_text:
-        st.write(f"**Market Target:** {market_text}")
-    st.write(f"**Budget:** ${total_budget:,.0f} | **Split:** {tourist_pct}% tourist / {industry_pct}% industry")
-    st.markdown("---")
+        header.append(f"**Market Target:** {market_text}")
+    header.append(f"**Budget:** ${total_budget:,.0f} | **Split:** {tourist_pct}% tourist / {industry_pct}% industry")
+    header.append("---")
+    st.markdown("\n\n".join(header))
 
     st.subheader("Tourist Pool")
-    _render_table("tourist", t_sel)
+    _render_table(t_sel, t_df)
     st.markdown("---")
     st.subheader("Industry Pool")
-    _render_table("industry", i_sel)
+    _render_table(i_sel, i_df)
 
-    st.markdown("---")
-    st.markdown(f"### Grand Total: ${grand_total:,.0f} (Hard cap = ${total_budget*1.10:,.0f})")
+    st.markdown(f"---\n\n### Grand Total: ${grand_total:,.0f} (Hard cap = ${total_budget*1.10:,.0f})")
 
     with st.expander("Allocator input preview"):
-        st.code(format_product_block(subset, {k: meta.get(k, {}) for k in subset.keys()}))
+        st.code(format_product_block(subset, meta_subset))
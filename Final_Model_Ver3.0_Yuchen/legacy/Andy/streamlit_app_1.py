@@ -2,19 +2,30 @@
 # UI for stateless Step 4–5 generator with: file OR manual input + auto-apply feedback.
 
 import json
-import re
+import random
+import time
+from functools import lru_cache
+from operator import attrgetter
 from pathlib import Path
 import streamlit as st
 
 # Reuse helpers from your minimal pipeline
 from legacy.Andy.simple_run import (
-    load_products, ensure_candidates, format_product_block,
+    load_products, canonical_index, ensure_candidates, format_product_block,
     format_descriptions_block, to_markdown, Proposal
 )
-from legacy.Andy.simple_schemas import InputPayload
+from ateema.io_loader import folder_stamp
+from legacy.Andy.simple_schemas import InputPayload, SimilarClient
+from legacy.Andy.simple_prompt import render_proposal
 from langchain_ollama import OllamaLLM
 from langchain_core.output_parsers import StrOutputParser
 
+try:
+    import httpx  # transport used by the Ollama client
+    _TRANSIENT_EXC: tuple = (ConnectionError, TimeoutError, httpx.TransportError)
+except ImportError:
+    _TRANSIENT_EXC = (ConnectionError, TimeoutError)
+
 # -------------------------
 # Streamlit page settings
 # -------------------------
@@ -25,62 +36,155 @@ st.caption("Uses local Ollama (Gemma 3:4b) • Consumes upstream input + product
 # -------------------------
 # Helpers: parse, retry, cap
 # -------------------------
-def _extract_first_json_block(text: str) -> str:
+def _find_balanced_json(text: str) -> str:
+    """First balanced {...} object in `text`, cleaned in the same pass.
+
+    Tracks string/escape state so braces inside strings don't count. Runs of
+    control characters become one space, and escaped \\n / \\t are flattened to
+    spaces. Anything before the object (e.g. a ```json fence) or after it is
+    ignored. Returns "" if no balanced object is found.
+    """
     start = text.find("{")
-    end = text.rfind("}")
-    return text[start:end+1] if (start != -1 and end != -1 and end > start) else ""
+    if start == -1:
+        return ""
+    out = []
+    depth = 0
+    in_string = False
+    in_ctrl = False
+    i, n = start, len(text)
+    while i < n:
+        c = text[i]
+        if c < " ":
+            if not in_ctrl:
+                out.append(" ")
+                in_ctrl = True
+            i += 1
+            continue
+        in_ctrl = False
+        if c == "\\" and i + 1 < n:
+            nxt = text[i + 1]
+            out.append(" " if nxt in "nt" else c + nxt)
+            i += 2
+            continue
+        out.append(c)
+        if c == '"':
+            in_string = not in_string
+        elif not in_string:
+            if c == "{":
+                depth += 1
+            elif c == "}":
+                depth -= 1
+                if depth == 0:
+                    return "".join(out)
+        i += 1
+    return ""
 
 def _tolerant_parse(raw: str) -> dict:
     if not raw or not raw.strip():
         raise ValueError("Model returned empty output (nothing to parse).")
+    # Happy path: clean model output parses directly, no cleanup strings are built
     try:
         return json.loads(raw)
     except Exception:
         pass
-    cleaned = re.sub(r"^```(?:json)?\s*|\s*```$", "", raw.strip(),
-                     flags=re.IGNORECASE | re.DOTALL)
-    cleaned = re.sub(r'[\x00-\x1F]+', ' ', cleaned)
-    cleaned = cleaned.replace('\\n', ' ').replace('\\t', ' ').replace('\r', ' ')
-    try:
-        return json.loads(cleaned)
-    except Exception:
-        pass
-    block = _extract_first_json_block(cleaned)
+    # One scan finds the object and drops control chars; fences/prose around it are skipped
+    block = _find_balanced_json(raw)
     if block:
         return json.loads(block)
     snippet = (raw[:500] + "…") if len(raw) > 500 else raw
     raise ValueError("Could not parse model output as JSON. First 500 chars:\n" + snippet)
 
-def _call_llm_with_retry(prompt_str: str, model_name: str, temperature: float, attempts: int = 2) -> str:
-    llm = OllamaLLM(model=model_name, temperature=temperature)
+# Generation cap: a full proposal JSON is well under this, and a runaway or
+# malformed response stops here instead of decoding to the context limit.
+_NUM_PREDICT = 4096
+
+@st.cache_resource(show_spinner=False)
+def _get_chain(model_name: str, temperature: float):
+    # One client + parser chain per (model, temperature), shared across reruns
+    return OllamaLLM(model=model_name, temperature=temperature, num_predict=_NUM_PREDICT) | StrOutputParser()
+
+# Backoff for transient Ollama failures: (max_retries, initial_delay, max_delay, backoff_factor)
+_RETRY_CFG = (3, 0.5, 8.0, 2.0)
+
+def _is_transient(e: Exception) -> bool:
+    """Connection drops, timeouts, 429 and 5xx are worth retrying; anything else is not."""
+    if isinstance(e, _TRANSIENT_EXC):
+        return True
+    code = getattr(e, "status_code", None)  # ollama.ResponseError / HTTP errors
+    return isinstance(code, int) and (code == 429 or code >= 500)
+
+def _invoke_with_retry(prompt_str: str, model_name: str, temperature: float, attempts: int) -> str:
+    chain = _get_chain(model_name, temperature)
+    max_retries, initial, max_delay, factor = _RETRY_CFG
     last = ""
-    for _ in range(attempts):
-        last = (llm | StrOutputParser()).invoke(prompt_str)
-        if last and last.strip():
+    tries = 0     # completed generations (empty output counts against `attempts`)
+    failures = 0  # transient errors (count against max_retries)
+    while tries < attempts:
+        try:
+            # Streamed: chunks arrive as they decode; retry only if the finished stream is blank
+            last = "".join(chain.stream(prompt_str))
+        except Exception as e:
+            if not _is_transient(e) or failures >= max_retries:
+                raise
+            time.sleep(min(max_delay, initial * factor ** failures) + random.uniform(0, 0.1))
+            failures += 1
+            continue
+        if last.strip():
             return last
+        tries += 1
     return last
 
+class _EmptyLLMOutput(Exception):
+    """Raised inside the cached call so an empty response is never cached."""
+
+@st.cache_data(ttl=3600, max_entries=256, show_spinner=False)
+def _cached_invoke(prompt_str: str, model_name: str, temperature: float, attempts: int) -> str:
+    # Exact-match prompt cache: a byte-identical prompt (rerun, re-click) skips the model decode
+    out = _invoke_with_retry(prompt_str, model_name, temperature, attempts)
+    if not (out and out.strip()):
+        raise _EmptyLLMOutput(out)
+    return out
+
+def _call_llm_with_retry(prompt_str: str, model_name: str, temperature: float, attempts: int = 2) -> str:
+    try:
+        return _cached_invoke(prompt_str, model_name, temperature, attempts)
+    except _EmptyLLMOutput as e:
+        return e.args[0]
+
 def _enforce_soft_cap(prop: Proposal, budget: float, soft_cap_pct: int) -> Proposal:
     cap = round(budget * (1 + soft_cap_pct/100), 2)
     if prop.subtotal is not None and prop.subtotal > cap:
-        prop.selections.sort(key=lambda s: float(s.line_total or 0), reverse=True)
-        removed = []
-        while len(prop.selections) > 1 and sum(float(s.line_total or 0) for s in prop.selections) > cap:
-            removed.append(prop.selections.pop(0))
-        prop = Proposal(**prop.model_dump())
+        sels = prop.selections
+        # line_total is always a float here: Selection's validator fills it in
+        sels.sort(key=attrgetter("line_total"), reverse=True)
+        # Drop largest-first with a running total; one slice delete instead of repeated pop(0)
+        total = sum(s.line_total for s in sels)
+        k = 0
+        while len(sels) - k > 1 and total > cap:
+            total -= sels[k].line_total
+            k += 1
+        removed = sels[:k]
+        del sels[:k]
+        prop.refresh_subtotal()  # selections are already validated
         removed_list = ", ".join(f"{r.product_name} (${r.line_total})" for r in removed) or "none"
         note = f"Soft cap enforced at ${cap} (budget ${budget} + {soft_cap_pct}%). Removed: {removed_list}. Final subtotal: ${prop.subtotal}."
         prop.notes = (prop.notes + " " if prop.notes else "") + note
     return prop
 
+# Prompt-embedded JSON is dumped compact; the model doesn't need indentation.
+_COMPACT = (",", ":")
+
+@lru_cache(maxsize=64)
+def _allowed_products_block(names: tuple) -> str:
+    return "\n".join(f"- {n}" for n in names)
+
 def _build_prompt(inp, subset, product_block, desc_block, budget_cap, soft_cap_pct) -> str:
-    from legacy.Andy.simple_prompt import PROPOSAL_PROMPT
     # Read survey extras if present; otherwise default
     business_type = st.session_state.get("_survey_business_type", "Local")
     alloc_impact = st.session_state.get("_survey_alloc_impact", 60)
     alloc_awareness = st.session_state.get("_survey_alloc_awareness", 40)
 
-    return PROPOSAL_PROMPT.format(
+    return render_proposal(
         profile=inp.client_profile,
         business_type=business_type,
         budget=inp.budget,
@@ -88,12 +192,24 @@ def _build_prompt(inp, subset, product_block, desc_block, budget_cap, soft_cap_p
         soft_cap_pct=soft_cap_pct,
         alloc_impact=alloc_impact,
         alloc_awareness=alloc_awareness,
-        similar_clients=json.dumps([sc.model_dump() for sc in inp.similar_clients], ensure_ascii=False, indent=2),
-        allowed_products="\n".join(f"- {n}" for n in subset.keys()),
+        similar_clients=json.dumps([sc.model_dump() for sc in inp.similar_clients], ensure_ascii=False, separators=_COMPACT),
+        allowed_products=_allowed_products_block(tuple(subset)),
         product_data=product_block,
         product_descriptions=desc_block,
     )
 
+@st.cache_data(show_spinner=False)
+def _load_products_cached(path: str, stamp: float):
+    return load_products(Path(path))
+
+@st.cache_data(show_spinner=False)
+def _canonical_index_cached(path: str, stamp: float):
+    return canonical_index(_load_products_cached(path, stamp))
+
+@st.cache_data(show_spinner=False)
+def _ensure_candidates_cached(candidates: tuple, path: str, stamp: float):
+    return ensure_candidates(list(candidates), _canonical_index_cached(path, stamp))
+
 # -------------------------
 # Sidebar controls
 # -------------------------
@@ -106,8 +222,9 @@ with st.sidebar:
     soft_cap_pct = st.slider("Soft cap (+%)", 0, 50, 10, 1, help="Allow total up to budget + this %, enforced.")
 
 # We need product names even for manual mode (to offer a multiselect)
+products_stamp = folder_stamp(products_path)
 try:
-    all_products_map = load_products(Path(products_path))
+    all_products_map = _load_products_cached(products_path, products_stamp)
     all_product_names = sorted(all_products_map.keys())
 except Exception as e:
     all_products_map, all_product_names = {}, []
@@ -117,6 +234,8 @@ except Exception as e:
 # Input area (file or manual)
 # -------------------------
 input_payload: InputPayload | None = None
+# Survey picks come from a multiselect over the real product names, so they need no fuzzy matching
+candidates_exact = False
 
 if input_mode == "Load JSON":
     input_path = st.text_input("Input JSON path", value=str(Path("../../Data/Inputs/input.json")))
@@ -147,7 +266,7 @@ elif input_mode == "Survey-style":
         sc_text = st.text_area("Examples:\nRiver North Hotel | ChicagoDoes Interactive Map, Concierge Email Blast | Strong email engagement")
 
         # We still need the product candidates
-        all_products_map = all_products_map if 'all_products_map' in globals() else load_products(Path(products_path))
+        all_products_map = all_products_map if 'all_products_map' in globals() else _load_products_cached(products_path, products_stamp)
         all_product_names = sorted(all_products_map.keys())
         candidate_products = st.multiselect("Candidate products (must be in Products folder)", options=all_product_names)
 
@@ -170,7 +289,6 @@ elif input_mode == "Survey-style":
             )
 
             # Parse similar clients from textarea
-            from legacy.Andy.simple_schemas import SimilarClient, InputPayload
             similar_clients = []
             for line in (sc_text or "").splitlines():
                 parts = [p.strip() for p in line.split("|")]
@@ -189,6 +307,8 @@ elif input_mode == "Survey-style":
                 candidate_products=candidate_products,
             )
 
+            candidates_exact = True
+
             # Stash the extra structured fields for the prompt formatter
             st.session_state["_survey_business_type"] = business_type
             st.session_state["_survey_alloc_impact"] = int(alloc_impact)
@@ -200,7 +320,15 @@ elif input_mode == "Survey-style":
 if input_payload is not None:
     try:
         # Whitelist candidate products from folder
-        present_real, missing_orig, name_map = ensure_candidates(input_payload.candidate_products, all_products_map)
+        if candidates_exact:
+            present_real = list(dict.fromkeys(n for n in input_payload.candidate_products if n in all_products_map))
+            missing_orig = [n for n in input_payload.candidate_products if n not in all_products_map]
+            name_map = {n: n for n in present_real}
+        elif all_products_map:
+            present_real, missing_orig, name_map = _ensure_candidates_cached(
+                tuple(input_payload.candidate_products), products_path, products_stamp)
+        else:  # catalog failed to load above; nothing to match against
+            present_real, missing_orig, name_map = ensure_candidates(input_payload.candidate_products, canonical_index(all_products_map))
         if not present_real:
             st.error("No candidate products matched. Check names or normalization against product files.")
             st.stop()
@@ -225,18 +353,21 @@ if input_payload is not None:
         c1, c2 = st.columns([2, 1])
 
         with c1:
+            # Rendered once; shared by the on-page view and the downloads
+            prop_dict = prop.model_dump()
+            prop_md = to_markdown(prop)
             st.subheader("Proposal")
-            st.markdown(to_markdown(prop))
+            st.markdown(prop_md)
             st.divider()
-            st.json(prop.model_dump(), expanded=False)
+            st.json(prop_dict, expanded=False)
 
             # Downloads
             st.download_button("Download proposal.json",
-                               data=json.dumps(prop.model_dump(), ensure_ascii=False, indent=2),
+                               data=json.dumps(prop_dict, ensure_ascii=False, indent=2),
                                file_name="../Data/Inputs/proposal.json",
                                mime="application/json")
             st.download_button("Download proposal.md",
-                               data=to_markdown(prop),
+                               data=prop_md,
                                file_name="proposal.md",
                                mime="text/markdown")
 
@@ -333,10 +464,10 @@ Product Descriptions:
 {desc_block}
 
 Current Proposal JSON:
-{json.dumps(prop.model_dump(), ensure_ascii=False, indent=2)}
+{json.dumps(prop.model_dump(), ensure_ascii=False, separators=_COMPACT)}
 
 Previous feedback (most recent first):
-{json.dumps(list(reversed(feedback_history))[:5], ensure_ascii=False, indent=2)}
+{json.dumps(feedback_history[:-6:-1], ensure_ascii=False, separators=_COMPACT)}
 
 New feedback to apply now:
 {feedback_now}
@@ -376,18 +507,20 @@ if apply_btn:
             st.session_state.feedback_history.append(feedback_text)
 
             st.success("Updated proposal applied.")
-            st.markdown(to_markdown(revised_prop))
-            st.json(revised_prop.model_dump(), expanded=False)
+            revised_dict = revised_prop.model_dump()
+            revised_md = to_markdown(revised_prop)
+            st.markdown(revised_md)
+            st.json(revised_dict, expanded=False)
 
             st.download_button(
                 "Download revised proposal.json",
-                data=json.dumps(revised_prop.model_dump(), ensure_ascii=False, indent=2),
+                data=json.dumps(revised_dict, ensure_ascii=False, indent=2),
                 file_name="proposal_revised.json",
                 mime="application/json",
             )
             st.download_button(
                 "Download revised proposal.md",
-                data=to_markdown(revised_prop),
+                data=revised_md,
                 file_name="proposal_revised.md",
                 mime="text/markdown",
             )
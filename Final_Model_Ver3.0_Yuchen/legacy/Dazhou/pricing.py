@@ -1,7 +1,11 @@
 from __future__ import annotations
+import re
+from bisect import bisect_right
+from operator import itemgetter
 from typing import Any, List, Tuple, Optional
 from datetime import date
 from .models import ProductRecord
+from ateema.pricing import cached_by_option
 
 # ================================================================
 # Helper: parse mm/dd -> mmdd integer
@@ -28,6 +32,15 @@ NAMED_WINDOWS = {
     "Before Christmas": (1101, 1224),
 }
 
+# All windows as one start-sorted table. No window overlaps another (exact
+# or named), so at most one contains a given date and a bisect on the
+# start keys finds it; exact windows sort first on a start tie.
+_ALL_WINDOWS = sorted(
+    [(s, e, 0, lbl) for lbl, (s, e) in EXACT_WINDOWS.items()]
+    + [(s, e, 1, lbl) for lbl, (s, e) in NAMED_WINDOWS.items()]
+)
+_WINDOW_STARTS = [w[0] for w in _ALL_WINDOWS]
+
 # ================================================================
 # Determine seasonal booth price
 # ================================================================
@@ -38,23 +51,22 @@ def booth_season_for_date(meta: dict, option_name: str, chosen_date: date) -> fl
 
     mmdd = _mmdd(chosen_date)
 
-    # 1) Exact windows first (always lowest)
-    for label, (start, end) in EXACT_WINDOWS.items():
-        if label in seasonal_map:
-            if start <= mmdd <= end:
-                return float(seasonal_map[label].get(option_name, None))
-
-    # 2) Named windows after exact windows
-    for label, (start, end) in NAMED_WINDOWS.items():
-        if label in seasonal_map:
-            if start <= mmdd <= end:
-                return float(seasonal_map[label].get(option_name, None))
+    # Containing window, if any (exact and named windows never overlap)
+    i = bisect_right(_WINDOW_STARTS, mmdd) - 1
+    if i >= 0:
+        start, end, _, label = _ALL_WINDOWS[i]
+        if mmdd <= end and label in seasonal_map:
+            return float(seasonal_map[label].get(option_name, None))
 
     return None
 
 # ================================================================
 # Existing helpers
 # ================================================================
+# Digit/dot runs in a tier label (e.g. "3X", "1.5 months"), used for tier order
+_NUM_RE = re.compile(r"[\d.]+")
+
+@cached_by_option
 def price_points(opt: dict) -> List[tuple[str, float]]:
     items = []
     if isinstance(opt.get("price_usd"), dict):
@@ -69,7 +81,7 @@ def price_points(opt: dict) -> List[tuple[str, float]]:
         items = []
 
     def _key(lbl: str, price: float):
-        num = "".join(ch for ch in lbl if ch.isdigit() or ch == ".")
+        num = "".join(_NUM_RE.findall(lbl))  # every digit/dot in the label, as before
         try:
             x = float(num)
         except:
@@ -78,6 +90,7 @@ def price_points(opt: dict) -> List[tuple[str, float]]:
 
     return sorted(items, key=lambda t: _key(t[0], t[1]))
 
+@cached_by_option
 def option_min_budget(opt: dict) -> float:
     v = opt.get("target_budget_min")
     try:
@@ -121,20 +134,26 @@ def upgrade_candidates(product: ProductRecord, current: tuple[str, str, float] |
         for lbl, base_price in price_points(opt):
             line = effective_line_price(product, lbl, base_price)
             if line > cur_line:
-                cands.append((opt_name, lbl, base_price, min_budget))
+                cands.append((opt_name, lbl, base_price, min_budget, line))
 
-    cands.sort(key=lambda t: effective_line_price(product, t[1], t[2]))
-    return cands
+    # Sort on the line price computed above; callers get the usual 4-tuples
+    cands.sort(key=itemgetter(4))
+    return [c[:4] for c in cands]
 
+@cached_by_option
 def first_known_price(opt: dict) -> float | None:
-    if isinstance(opt.get("price_usd"), dict):
-        return max(float(v) for v in opt["price_usd"].values())
-    if isinstance(opt.get("price_usd_by_plan"), dict):
-        return max(float(v) for v in opt["price_usd_by_plan"].values())
-    if isinstance(opt.get("price_usd"), (int, float)):
-        return float(opt["price_usd"])
-    if isinstance(opt.get("pricing"), dict):
-        return max(float(v) for v in opt["pricing"].values())
+    # Precedence and single cast as in ateema.pricing.first_known_price
+    pu = opt.get("price_usd")
+    if isinstance(pu, dict):
+        return float(max(pu.values()))
+    plan = opt.get("price_usd_by_plan")
+    if isinstance(plan, dict):
+        return float(max(plan.values()))
+    if isinstance(pu, (int, float)):
+        return float(pu)
+    pricing = opt.get("pricing")
+    if isinstance(pricing, dict):
+        return float(max(pricing.values()))
     return None
 
 # ================================================================
@@ -167,6 +186,14 @@ def get_effective_unit_price(product_name: str,
 # ================================================================
 # Advertiser-specific price overrides (Dazhou 11/17)
 # ================================================================
+# (product name, option predicate, price, label), checked in order; first match wins.
+# Ambassador Program and "Summit — Booth" advertiser rates are still to be
+# decided (占位) — add their rows here once the amounts are known.
+_ADV_RULES = (
+    ("Email Blast", lambda o: "Blast Email - concierge" in o, 450.0, "Existing advertiser contract rate"),  # Contract with multiple products
+)
+_ADV_NAMES = frozenset(r[0] for r in _ADV_RULES)
+
 def advertiser_overrides(
     product_name: str,
     option_name: str,
@@ -187,53 +214,55 @@ def advertiser_overrides(
         return None, None
 
     name = (product_name or "").strip()
-    opt  = (option_name or "").strip()
-
-    # TODO: 你之后在这里填具体规则
-    # 例子结构（先占坑，具体金额你后面给我）：
-
-    # 1) Email Blast 系列
-    if name == "Email Blast" and "Blast Email - concierge" in opt:
-            if is_advertiser:
-                new_price = 450.0  # Contract with multiple products
-                label = "Existing advertiser contract rate"
-                return new_price, label
-            # 非 advertiser 继续走默认折扣逻辑
-            return None, None
-
-    # 2) Ambassador Program 系列
-    if name == "Ambassador Program":
-        # 标准项目
-        if opt.startswith("Standard Ambassador Program"):
-            # new_price = ...
-            # label = "Existing advertiser rate"
-            # return new_price, label
-            return None, None  # 占位
-
-        # Concierge Intro 项目
-        if opt.startswith("Ambassador - Concierge Intro"):
-            # new_price = ...
-            # label = "Existing advertiser rate"
-            # return new_price, label
-            return None, None  # 占位
-
-    # 3) Summit Booth 系列
-    # 注意：Summit Booth 的产品名在 JSON 里是 "Summit — Booth"
-    if name == "Summit — Booth":
-        # 这里你可以根据 tier/option name 决定专门价格
-        # 例如：
-        # if "Basic Booth — advertiser rate" in opt:
-        #     new_price = ...
-        #     label = "Existing advertiser special"
-        #     return new_price, label
-        return None, None  # 占位
-
-    # 没有匹配任何 advertiser 规则，就走默认折扣逻辑
+    if name not in _ADV_NAMES:
+        # 没有匹配任何 advertiser 规则，就走默认折扣逻辑
+        return None, None
+
+    opt = (option_name or "").strip()
+    for rule_name, matches, new_price, label in _ADV_RULES:
+        if rule_name == name and matches(opt):
+            return new_price, label
     return None, None
 
 # ================================================================
-# Discount Logic (unchanged)
+# Discount Logic (unchanged) — one handler per product, dispatched by name
+# Handlers take (opt, price, has_other_products, prepay_full_year) and
+# return (final_price, label).
 # ================================================================
+def _email_blast(opt, price, has_other_products, prepay_full_year):
+    if "Blast Email - concierge" in opt:
+        if has_other_products:
+            return 450.0, "Contract bundle price (with other products)"
+        return 750.0, None
+    # Planner Eblast and anything else: list price
+    return price, None
+
+def _reels(opt, price, has_other_products, prepay_full_year):
+    if has_other_products:
+        return 895.0, "With other purchase discount"
+    return 995.0, None
+
+def _ambassador(opt, price, has_other_products, prepay_full_year):
+    if opt.startswith("Standard Ambassador Program"):
+        retail, with_campaign = 3200.0, 2950.0
+    elif opt.startswith("Ambassador - Concierge Intro"):
+        retail, with_campaign = 3000.0, 2750.0
+    else:
+        return price, None
+    return (with_campaign, "With Any Campaign rate") if has_other_products else (retail, None)
+
+def _interactive_map(opt, price, has_other_products, prepay_full_year):
+    if prepay_full_year:
+        return round(price * 0.9, 2), "Prepay entire year – 10% off"
+    return price, None
+
+_DISCOUNT_HANDLERS = {
+    "Email Blast": _email_blast,
+    "Chicago Does Reels": _reels,
+    "Ambassador Program": _ambassador,
+    "Chicago Does Interactive Map": _interactive_map,
+}
+
 def apply_discounts(
     product_name: str,
     option_name: str,
@@ -246,7 +275,6 @@ def apply_discounts(
 
     name = (product_name or "").strip()
     opt = (option_name or "").strip()
-    label = None
     final_price = float(base_price)
     
     # Check whether the product have advertiser discounts (Dazhou 11/17)
@@ -259,33 +287,8 @@ def apply_discounts(
     )
     if adv_price is not None:
         return adv_price, adv_label
-    
-    if name == "Email Blast" and "Blast Email - concierge" in opt:
-        if has_other_products:
-            return 450.0, "Contract bundle price (with other products)"
-        return 750.0, None
 
-    if name == "Email Blast" and "Planner Eblast" in opt:
+    handler = _DISCOUNT_HANDLERS.get(name)
+    if handler is None:
         return final_price, None
-
-    if name == "Chicago Does Reels":
-        if has_other_products:
-            return 895.0, "With other purchase discount"
-        return 995.0, None
-
-    if name == "Ambassador Program":
-        if opt.startswith("Standard Ambassador Program"):
-            retail, with_campaign = 3200.0, 2950.0
-        elif opt.startswith("Ambassador - Concierge Intro"):
-            retail, with_campaign = 3000.0, 2750.0
-        else:
-            return final_price, None
-        return (with_campaign, "With Any Campaign rate") if has_other_products else (retail, None)
-
-    if name == "Chicago Does Interactive Map":
-        if prepay_full_year:
-            return round(base_price * 0.9, 2), "Prepay entire year – 10% off"
-        return final_price, None
-
-    return final_price, None
-
+    return handler(opt, final_price, has_other_products, prepay_full_year)
@@ -1,11 +1,14 @@
 
 # -*- coding: utf-8 -*-
 # Note: requires faiss (CPU or GPU), sentence-transformers, pandas, numpy, pyarrow
-import json, re
+import heapq, json, math, os, re
+from functools import lru_cache
 from pathlib import Path
 import numpy as np
 import pandas as pd
+import pyarrow.parquet as pq
 import faiss
+import torch
 from sentence_transformers import SentenceTransformer
 from typing import Any, Dict, List, Tuple
 
@@ -19,17 +22,45 @@ model_name = meta.get("model_name", "BAAI/bge-small-en-v1.5")
 dim = int(meta.get("dim", 384))
 
 model = SentenceTransformer(model_name)
+if torch.cuda.is_available():
+    model.half()  # FP16 inference on GPU; CPU stays FP32
 assert model.get_sentence_embedding_dimension() == dim, \
     f"Dim mismatch: index expects {dim}, model gives {model.get_sentence_embedding_dimension()}"
 
 index = faiss.read_index(str(INDEX_PATH))
-df_map = pd.read_parquet(MAP_PARQUET)
 
-# ========== Helpers ==========
-def l2_normalize(v: np.ndarray) -> np.ndarray:
-    n = np.linalg.norm(v, axis=1, keepdims=True) + 1e-12
-    return v / n
+ID_CANDS   = ["id","customer_id","client_id","ID","__row_id__"]
+TEXT_CANDS = ["text","profile_text","doc_text","content","desc","description","__auto_text__"]
+
+# Only the columns the hit loop reads are loaded; the schema is peeked first.
+_schema    = pq.ParquetFile(MAP_PARQUET).schema_arrow
+_index_cols = {c for c in (_schema.pandas_metadata or {}).get("index_columns", []) if isinstance(c, str)}
+_map_cols  = [c for c in _schema.names if c not in _index_cols]
+id_col     = next(c for c in ID_CANDS if c in _map_cols)
+text_col   = next((c for c in TEXT_CANDS if c in _map_cols), None)
+_use_cols  = [c for c in (id_col, "metadata", "customer_name", text_col) if c and c in _map_cols]
 
+# Search breadth for approximate indexes is set once here; flat indexes ignore it.
+IVF_MIN_NPROBE = 8
+HNSW_EF_SEARCH = 64
+try:
+    _ivf = faiss.extract_index_ivf(index)
+    faiss.ParameterSpace().set_index_parameter(index, "nprobe", max(IVF_MIN_NPROBE, int(math.sqrt(_ivf.nlist))))
+except RuntimeError:
+    pass  # not an IVF index
+if hasattr(index, "hnsw"):
+    index.hnsw.efSearch = HNSW_EF_SEARCH
+
+# Move the index to GPU 0 when one is visible (the cloned index keeps nprobe).
+# IVF lists are stored as FP16 there; HNSW has no GPU implementation and stays on CPU.
+if faiss.get_num_gpus() > 0 and not hasattr(index, "hnsw"):
+    _gpu_res = faiss.StandardGpuResources()
+    _co = faiss.GpuClonerOptions()
+    _co.useFloat16 = True
+    _co.useFloat16CoarseQuantizer = False
+    index = faiss.index_cpu_to_gpu(_gpu_res, 0, index, _co)
+
+# ========== Helpers ==========
 def to_dict(x: Any) -> Dict[str, Any]:
     if isinstance(x, dict):
         return x
@@ -40,6 +71,8 @@ def to_dict(x: Any) -> Dict[str, Any]:
             return {}
     return {}
 
+_PRODUCT_SEPS = str.maketrans("|;/", ",,,")  # every separator becomes ","
+
 def normalize_products(val: Any) -> List[str]:
     if val is None:
         return []
@@ -48,20 +81,23 @@ def normalize_products(val: Any) -> List[str]:
     if isinstance(val, dict):
         return [str(k).strip() for k in val.keys() if str(k).strip()]
     if isinstance(val, str) and val.strip():
-        return [p.strip() for p in re.split(r"[,\|;/]+", val) if p.strip()]
+        return [p.strip() for p in val.translate(_PRODUCT_SEPS).split(",") if p.strip()]
     return [str(val).strip()]
 
-ID_CANDS   = ["id","customer_id","client_id","ID","__row_id__"]
-TEXT_CANDS = ["text","profile_text","doc_text","content","desc","description","__auto_text__"]
-id_col     = next(c for c in ID_CANDS if c in df_map.columns)
-text_col   = next((c for c in TEXT_CANDS if c in df_map.columns), None)
+
+# ASCII names: one translate pass maps every non-word char to a space.
+_NAME_TRANS = str.maketrans({c: " " for c in map(chr, range(128)) if not (c.isalnum() or c == "_")})
+_NON_WORD_RE = re.compile(r"[^\w]+")
 
 def _normalize_name(name: str) -> str:
     if not name:
         return ""
-    s = re.sub(r"[^\w]+", " ", str(name))
-    s = re.sub(r"\s+", " ", s)
-    return s.strip().casefold()
+    s = str(name)
+    if s.isascii():
+        s = s.translate(_NAME_TRANS)
+    else:
+        s = _NON_WORD_RE.sub(" ", s)  # Unicode \w semantics for non-ASCII names
+    return " ".join(s.split()).casefold()
 
 _SUMMIT_ALLOWED = {"Booth Non Advertiser", "Booth Advertiser", "Sponsorship"}
 
@@ -89,6 +125,112 @@ def build_purchased_tokens(meta: Dict[str, Any]) -> List[str]:
         return normalize_products(root)
     return normalize_products(detail)
 
+# ---- Per-row customer key / display name / snippet / purchased tokens ----
+# Metadata is fixed once the index is built, so the JSON parse, name
+# normalization and token building run once per row rather than per hit.
+# save_row_caches() persists the results beside the parquet: keys, names and
+# snippets as fixed-width string arrays that are memory-mapped on load, tokens
+# as a pickled object array. Import only reads them; with fresh caches the
+# parquet itself is never read, otherwise the rows are built in memory.
+_ROW_NPY = {n: MAP_PARQUET.with_suffix(f".{n}.npy") for n in ("keys", "names", "snippets", "tokens")}
+
+def _object_array(items: List[Any]) -> np.ndarray:
+    arr = np.empty(len(items), dtype=object)
+    for i, x in enumerate(items):
+        arr[i] = x
+    return arr
+
+def _rows_fresh() -> bool:
+    src = MAP_PARQUET.stat().st_mtime
+    return all(p.exists() and p.stat().st_mtime >= src for p in _ROW_NPY.values())
+
+def _build_rows() -> Dict[str, np.ndarray]:
+    df_map = pd.read_parquet(MAP_PARQUET, columns=_use_cols, engine="pyarrow", memory_map=True)
+
+    def _col(name: str | None) -> np.ndarray | None:
+        return df_map[name].to_numpy(copy=False) if name and name in df_map.columns else None
+
+    meta_arr, id_arr = _col("metadata"), _col(id_col)
+    text_arr, cust_arr = _col(text_col), _col("customer_name")
+
+    keys: List[str] = []
+    names: List[str] = []
+    snippets: List[str] = []
+    tokens: List[List[str]] = []
+    for i in range(len(df_map)):
+        meta = to_dict(meta_arr[i]) if meta_arr is not None else {}
+        customer_name = (
+            meta.get("customer")
+            or meta.get("client")
+            or meta.get("name")
+            or (cust_arr[i] if cust_arr is not None else None)
+        )
+        keys.append(_normalize_name(customer_name) or f"id::{str(id_arr[i])}")
+        names.append(str(customer_name or id_arr[i]))
+        snippets.append((str(text_arr[i])[:200] + "…") if text_arr is not None else "")
+        tokens.append(build_purchased_tokens(meta))
+
+    return {
+        "keys": np.array(keys, dtype=str),
+        "names": np.array(names, dtype=str),
+        "snippets": np.array(snippets, dtype=str),
+        "tokens": _object_array(tokens),
+    }
+
+def _load_rows() -> Dict[str, np.ndarray]:
+    if _rows_fresh():
+        rows = {n: np.load(p, mmap_mode="r") for n, p in _ROW_NPY.items() if n != "tokens"}
+        rows["tokens"] = np.load(_ROW_NPY["tokens"], allow_pickle=True)
+        return rows
+    return _build_rows()
+
+# ---- Index build (offline; nothing here runs at import) ----
+def build_ivf_index(xb: np.ndarray) -> "faiss.Index":
+    """Build an IVF inner-product index (nlist ~ 2*sqrt(N)) to replace the flat one at INDEX_PATH."""
+    xb = np.ascontiguousarray(xb, dtype="float32")
+    nlist = max(1, int(2 * math.sqrt(xb.shape[0])))
+    ivf = faiss.index_factory(xb.shape[1], f"IVF{nlist},Flat", faiss.METRIC_INNER_PRODUCT)
+    ivf.train(xb)
+    ivf.add(xb)
+    return ivf
+
+def write_mapping_parquet(df: pd.DataFrame, path: Path = MAP_PARQUET) -> None:
+    """Write the row mapping with `metadata` as an Arrow struct column.
+
+    Struct columns come back from read_parquet as dicts, so to_dict() returns
+    them as-is instead of running json.loads on every row at load.
+    """
+    out = df.copy()
+    if "metadata" in out.columns:
+        out["metadata"] = out["metadata"].map(to_dict)
+    out.to_parquet(path, engine="pyarrow", index=False)
+
+def save_row_caches() -> None:
+    """Write the per-row caches beside MAP_PARQUET (part of build_artifacts)."""
+    rows = _build_rows()
+    for n, p in _ROW_NPY.items():
+        np.save(p, rows[n], allow_pickle=(n == "tokens"))
+
+def build_artifacts(ivf: bool = False) -> None:
+    """Rebuild step; run after regenerating the mapping parquet or the flat index.
+
+    Rewrites MAP_PARQUET with `metadata` as a struct column, optionally replaces
+    the flat index at INDEX_PATH with an IVF one over the same vectors, then
+    writes the per-row caches. Run from the project root with
+    `python -m partner.client_to_product_final --build [--ivf]`.
+    """
+    write_mapping_parquet(pd.read_parquet(MAP_PARQUET, engine="pyarrow"))
+    if ivf:
+        flat = faiss.read_index(str(INDEX_PATH))  # CPU copy; the module-level index may be on GPU
+        xb = flat.reconstruct_n(0, flat.ntotal)
+        faiss.write_index(build_ivf_index(xb), str(INDEX_PATH))
+    save_row_caches()
+
+_ROWS = _load_rows()
+KEY_ARR, NAME_ARR = _ROWS["keys"], _ROWS["names"]
+SNIPPET_ARR, TOKENS_ARR = _ROWS["snippets"], _ROWS["tokens"]
+PRODS_ARR = _object_array([frozenset(t) for t in TOKENS_ARR])
+
 def profile_to_query(p: Dict[str, Any]) -> str:
     def _fmt(label: str, val: Any) -> str:
         if val is None or (isinstance(val, str) and not val.strip()):
@@ -106,81 +248,133 @@ def profile_to_query(p: Dict[str, Any]) -> str:
     parts = [x for x in parts if x]
     return "query: " + " | ".join(parts) if parts else "query: "
 
-def _topk_buckets_from_query_text(qtext: str, k: int = 5, oversample: int = 20):
-    qvec  = model.encode([qtext], convert_to_numpy=True, normalize_embeddings=False).astype("float32")
-    qvec  = l2_normalize(qvec)
+@lru_cache(maxsize=4096)
+def _encode_query_bytes(qtext: str) -> bytes:
+    # Normalize in-tensor (on the model's device) and make a single host copy for FAISS.
+    emb = model.encode([qtext], convert_to_tensor=True, normalize_embeddings=True)
+    return emb.detach().float().contiguous().cpu().numpy().tobytes()
 
+def _encode_query(qtext: str) -> np.ndarray:
+    # Cached as bytes so callers can never mutate a shared cached array.
+    return np.frombuffer(_encode_query_bytes(qtext), dtype="float32").reshape(1, -1)
+
+def _n_hits(k: int, oversample: int) -> Tuple[int, int]:
     total = int(index.ntotal)
     k = max(1, min(int(k), total))
-    nprobe = min(max(k * oversample, k), total)
-    D, I = index.search(qvec, nprobe)
+    # Number of hits to pull before de-duplicating by customer (not the IVF nprobe).
+    return k, min(max(k * oversample, k), total)
 
-    buckets: Dict[str, Dict[str, Any]] = {}
+def _buckets_from_hits(ids: np.ndarray, scores: np.ndarray, k: int | None = None) -> Dict[str, Dict[str, Any]]:
+    """Group hits by customer key; with k, only the k best customers are materialized."""
+    # Pass 1: scalar bookkeeping only (best score, its row, and the rows per key).
+    best: Dict[str, float] = {}
+    best_idx: Dict[str, int] = {}
+    rows: Dict[str, List[int]] = {}
+    keep = ids >= 0
+    for idx, score in zip(ids[keep].tolist(), scores[keep].tolist()):
+        key = str(KEY_ARR[idx])
+        r = rows.get(key)
+        if r is None:
+            rows[key] = [idx]
+            best[key] = score
+            best_idx[key] = idx
+        else:
+            r.append(idx)
+            if score > best[key]:
+                best[key] = score
+                best_idx[key] = idx
 
-    for idx, score in zip(I[0], D[0]):
-        if int(idx) < 0:
-            continue
-        rec  = df_map.iloc[int(idx)]
-        meta = to_dict(rec.get("metadata"))
+    # Pass 2: token unions and snippets for the survivors (stable, best first).
+    keys = list(rows) if k is None else heapq.nlargest(k, rows, key=best.__getitem__)
+    buckets: Dict[str, Dict[str, Any]] = {}
+    for key in keys:
+        purchased: set = set()
+        for j in rows[key]:
+            purchased |= PRODS_ARR[j]
+        i = best_idx[key]
+        buckets[key] = {
+            "name": str(NAME_ARR[rows[key][0]]),
+            "purchased_set": purchased,
+            "best_score": float(best[key]),
+            "text_snippet": str(SNIPPET_ARR[i]),
+        }
 
-        customer_name = (
-            meta.get("customer")
-            or meta.get("client")
-            or meta.get("name")
-            or (rec.get("customer_name") if "customer_name" in df_map.columns else None)
-        )
-        key = _normalize_name(customer_name) or f"id::{str(rec[id_col])}"
+    return buckets
 
-        prods = build_purchased_tokens(meta)
+def _topk_buckets_from_query_text(qtext: str, k: int = 5, oversample: int = 20):
+    qvec = _encode_query(qtext)
+    k, n_hits = _n_hits(k, oversample)
+    D, I = index.search(qvec, n_hits)
+    return _buckets_from_hits(I[0], D[0], k)
 
-        score_f = float(score)
-        if key not in buckets:
-            buckets[key] = {
-                "name": customer_name or str(rec[id_col]),
-                "purchased_set": set(prods),
-                "best_score": score_f,
-                "text_snippet": (str(rec[text_col])[:200] + "…") if text_col else "",
-            }
-        else:
-            buckets[key]["purchased_set"].update(prods)
-            if score_f > buckets[key]["best_score"]:
-                buckets[key]["best_score"] = score_f
-                buckets[key]["text_snippet"] = (str(rec[text_col])[:200] + "…") if text_col else ""
+def _ranked(buckets: Dict[str, Dict[str, Any]]) -> Tuple[Tuple[str, frozenset, float, str], ...]:
+    """Freeze buckets into (name, purchased, best_score, snippet) rows, best first."""
+    vals = sorted(buckets.values(), key=lambda x: x["best_score"], reverse=True)
+    return tuple((b["name"], frozenset(b["purchased_set"]), b["best_score"], b["text_snippet"]) for b in vals)
 
-    return buckets
+@lru_cache(maxsize=256)
+def _cached_buckets(qtext: str, k: int, oversample: int) -> Tuple[Tuple[str, frozenset, float, str], ...]:
+    # Shared by similar_clients_json and the table view so one profile costs one search.
+    return _ranked(_topk_buckets_from_query_text(qtext, k=k, oversample=oversample))
 
-def similar_clients_json(new_client: Dict[str, Any], k: int = 5, oversample: int = 20) -> Dict[str, Any]:
-    qtext = profile_to_query(new_client)
-    buckets = _topk_buckets_from_query_text(qtext, k=k, oversample=oversample)
-    rows = sorted(buckets.values(), key=lambda x: x["best_score"], reverse=True)[:k]
+def _similar_clients_payload(rows) -> Dict[str, Any]:
     return {
         "similar_clients": [
             {
-                "name": r["name"],
-                "purchased": sorted(r["purchased_set"]) if r["purchased_set"] else [],
+                "name": name,
+                "purchased": sorted(purchased) if purchased else [],
                 "notes": ""
             }
-            for r in rows
+            for name, purchased, _, _ in rows
         ]
     }
 
+def similar_clients_json(new_client: Dict[str, Any], k: int = 5, oversample: int = 20) -> Dict[str, Any]:
+    qtext = profile_to_query(new_client)
+    return _similar_clients_payload(_cached_buckets(qtext, k, oversample)[:k])
+
+# Below this many profiles, worker start-up costs more than the encode itself.
+MULTI_PROCESS_MIN_PROFILES = 256
+
+def similar_clients_batch(profiles: List[Dict[str, Any]], k: int = 5, oversample: int = 20,
+                          batch_size: int = 64, processes: int = 0) -> List[Dict[str, Any]]:
+    """similar_clients_json for many profiles: one batched encode and one FAISS search.
+
+    processes > 1 spreads the encode over that many CPU worker processes for
+    large batches (sentence-transformers multi-process pool).
+    """
+    if not profiles:
+        return []
+    qtexts = [profile_to_query(p) for p in profiles]
+    if processes > 1 and len(qtexts) >= MULTI_PROCESS_MIN_PROFILES:
+        pool = model.start_multi_process_pool(["cpu"] * min(processes, os.cpu_count() or 1))
+        try:
+            emb = model.encode_multi_process(qtexts, pool, batch_size=batch_size, normalize_embeddings=True)
+        finally:
+            model.stop_multi_process_pool(pool)
+    else:
+        emb = model.encode(qtexts, batch_size=batch_size, convert_to_numpy=True, normalize_embeddings=True)
+    qvecs = np.ascontiguousarray(emb, dtype="float32")  # already unit-norm from the model
+    k, n_hits = _n_hits(k, oversample)
+    D, I = index.search(qvecs, n_hits)
+    return [_similar_clients_payload(_ranked(_buckets_from_hits(I[row], D[row], k))) for row in range(len(qtexts))]
+
 def search_topk_customers_name_unique_with_products(
     new_client: Dict[str, Any],
     k: int = 5,
     oversample: int = 20
 ) -> Tuple[List[Dict[str, Any]], pd.DataFrame]:
     qtext = profile_to_query(new_client)
-    buckets = _topk_buckets_from_query_text(qtext, k=k, oversample=oversample)
-    vals = sorted(buckets.values(), key=lambda x: x["best_score"], reverse=True)[:k]
+    vals = _cached_buckets(qtext, k, oversample)[:k]
 
     rows: List[Dict[str, Any]] = []
-    for i, b in enumerate(vals, start=1):
+    for i, (name, purchased, best_score, snippet) in enumerate(vals, start=1):
         rows.append({
             "rank": i,
-            "customer_name": b["name"],
-            "relevance": round(b["best_score"], 4),
-            "product_detail": sorted(b["purchased_set"]) if b["purchased_set"] else None,
-            "text_snippet": b["text_snippet"],
+            "customer_name": name,
+            "relevance": round(best_score, 4),
+            "product_detail": sorted(purchased) if purchased else None,
+            "text_snippet": snippet,
         })
 
     df_table = pd.DataFrame([{
@@ -204,11 +398,13 @@ def format_client_profile(nc: Dict[str, Any]) -> str:
 
 def build_client_summary_json(new_client: Dict[str, Any], k: int = 5, budget: int = 50000) -> Dict[str, Any]:
     sc = similar_clients_json(new_client, k=k)
-    all_products: List[str] = []
+    seen: Dict[str, None] = {}
     for item in sc["similar_clients"]:
-        prods = item.get("purchased", []) or []
-        all_products.extend([str(p).strip() for p in prods if str(p).strip()])
-    candidate_products = sorted(set(all_products))
+        for p in item.get("purchased", []) or []:
+            p = str(p).strip()
+            if p:
+                seen[p] = None
+    candidate_products = sorted(seen)
     output = {
         "client_profile": format_client_profile(new_client),
         "budget": budget,
@@ -217,10 +413,12 @@ def build_client_summary_json(new_client: Dict[str, Any], k: int = 5, budget: in
     }
     return output
 
+_SLUG_RE = re.compile(r"[^\w\-]+")
+
 def save_and_download_json(payload: Dict[str, Any], business_name: str = "client", fname_suffix: str = "summary"):
     def slugify(s: str) -> str:
         s = str(s) if s is not None else "client"
-        s = re.sub(r"[^\w\-]+", "_", s).strip("_")
+        s = _SLUG_RE.sub("_", s).strip("_")
         return s or "client"
     fname = f"{slugify(business_name)}_{fname_suffix}.json"
     out_path = f"./{fname}"
@@ -229,6 +427,18 @@ def save_and_download_json(payload: Dict[str, Any], business_name: str = "client
     print(f"Saved to: {out_path}")
 
 if __name__ == "__main__":
+    import argparse
+    ap = argparse.ArgumentParser(description="Similar-client lookup demo / index artifact rebuild")
+    ap.add_argument("--build", action="store_true", help="rebuild the mapping parquet and per-row caches, then exit")
+    ap.add_argument("--ivf", action="store_true", help="with --build, also replace the flat index with an IVF index")
+    ap.add_argument("--threads", type=int, default=os.cpu_count() or 1, help="torch CPU threads for encoding")
+    args = ap.parse_args()
+    # Process-wide setting, so only the standalone run changes it
+    torch.set_num_threads(max(1, args.threads))
+    if args.build:
+        build_artifacts(ivf=args.ivf)
+        raise SystemExit(0)
+
     demo_client = {
         "Business Name": "newclient",
         "Type": "Local Business",
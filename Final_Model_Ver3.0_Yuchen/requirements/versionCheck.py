@@ -1,4 +1,4 @@
-import pkg_resources
+from importlib.metadata import version, PackageNotFoundError
 
 packages = [
     "streamlit",
@@ -13,7 +13,6 @@ packages = [
 
 for pkg in packages:
     try:
-        version = pkg_resources.get_distribution(pkg).version
-        print(f"{pkg} == {version}")
-    except Exception:
+        print(f"{pkg} == {version(pkg)}")
+    except PackageNotFoundError:
         print(f"{pkg} not installed")
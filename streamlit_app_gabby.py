@@ -1,12 +1,15 @@
 
 from __future__ import annotations
-import json
+import os
 import re
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Dict, List
+import numpy as np
+import pandas as pd
 import streamlit as st
 
-from ateema.io_loader import load_products
+from ateema.io_loader import load_products, read_json
 from ateema.summit_rules import apply_summit_rules
 from ateema.catalog import partition_by_category
 from ateema.upgrader import run_fill_to_cap
@@ -14,35 +17,51 @@ from ateema.formatting import format_product_block
 from ateema.pricing import apply_discounts
 
 
+def _try_parse(path) -> str | None:
+    """Parse error message for a JSON file, or None if it parses."""
+    try:
+        read_json(path)
+    except Exception as e:
+        return str(e)
+    return None
+
+
 # ---------- Awards config (Gabby) ----------
 BASE_DIR = Path(__file__).resolve().parents[1]  # .../Final_Model_Ver2.0_Dazhou
 AWARDS_PATH = BASE_DIR / "Data" / "PriceStrategy" / "AwardsConfig" / "Summit_Awards.json"
 
-try:
-    with AWARDS_PATH.open("r", encoding="utf-8") as f:
-        AWARDS_CONFIG = json.load(f)
-
-    # 1) 所有 general_category，用于下拉框
-    GENERAL_AWARD_CATEGORIES = sorted(
-        {a.get("general_category") for a in AWARDS_CONFIG if a.get("general_category")}
-    )
-
-    # 2) 自动生成 Business Type → Award 的映射
-    BUSINESS_TYPE_TO_AWARD = {}
+@st.cache_data(show_spinner=False)
+def _load_awards(path: str, mtime_ns: int) -> tuple[list, list, dict]:
+    """Parse Summit_Awards.json once per file version (mtime_ns is the cache key)."""
+    awards = read_json(path)
 
-    for a in AWARDS_CONFIG:
+    categories = set()
+    # 自动生成 Business Type → Award 的映射
+    bt_to_award = {}
+    for a in awards:
         award_name = a.get("name")
         gen_cat = a.get("general_category")
+        if gen_cat:
+            categories.add(gen_cat)
+        if not award_name:
+            continue
 
-        # 2-1. general_category 本身也可以直接映射到 award
-        if gen_cat and award_name:
-            BUSINESS_TYPE_TO_AWARD[gen_cat] = award_name
+        # general_category 本身也可以直接映射到 award
+        if gen_cat:
+            bt_to_award[gen_cat] = award_name
 
-        # 2-2. 把 eligible_business_types 也映射到同一个 award
+        # 把 eligible_business_types 也映射到同一个 award
         for bt in a.get("eligible_business_types", []):
-            if bt and award_name:
-                BUSINESS_TYPE_TO_AWARD.setdefault(bt, award_name)
+            if bt:
+                bt_to_award.setdefault(bt, award_name)
 
+    # 所有 general_category，用于下拉框
+    return awards, sorted(categories), bt_to_award
+
+try:
+    AWARDS_CONFIG, GENERAL_AWARD_CATEGORIES, BUSINESS_TYPE_TO_AWARD = _load_awards(
+        str(AWARDS_PATH), AWARDS_PATH.stat().st_mtime_ns
+    )
 except Exception as e:
     AWARDS_CONFIG = []
     GENERAL_AWARD_CATEGORIES = []
@@ -66,68 +85,126 @@ with st.sidebar:
     soft_cap_pct = st.slider("Soft cap (+%)", 0, 50, 10, 1)
 
 # ---------- Utils ----------
-def list_jsons(folder: Path) -> List[str]:
+# Profile fields are "Key: value" lines; anchored per line so a match never
+# scans past the line end or spills into the next field when a value is blank.
+_FOCUS_RE = re.compile(r"^[ \t]*Focus:[ \t]*(\S.*?)[ \t]*$", re.IGNORECASE | re.MULTILINE)
+_TARGET_RE = re.compile(r"^[ \t]*Market Target:[ \t]*(\S.*?)[ \t]*$", re.IGNORECASE | re.MULTILINE)
+_AUDIENCE_RE = re.compile(r"^[ \t]*Audience Type:[ \t]*(\S.*?)[ \t]*$", re.IGNORECASE | re.MULTILINE)
+
+def _json_entries(folder) -> List[os.DirEntry]:
+    # scandir yields names + file type without building a Path per entry
+    with os.scandir(folder) as it:
+        return [e for e in it if e.name.endswith(".json") and e.is_file()]
+
+def _mtime_sig(folder: Path) -> tuple:
+    """(name, mtime_ns) of each *.json; changes whenever a product file is added, removed or edited."""
+    try:
+        return tuple(sorted((e.name, e.stat().st_mtime_ns) for e in _json_entries(folder)))
+    except Exception:
+        return ()
+
+@st.cache_data(show_spinner=False)
+def list_jsons(folder_str: str, mtime_sig: tuple) -> List[str]:
     try:
-        return sorted([str(p) for p in folder.glob("*.json")])
+        return sorted(e.path for e in _json_entries(folder_str))
     except Exception:
         return []
 
+def _first_clause(text) -> str | None:
+    """Text up to the first period, or None when there is no text.
+
+    Non-string values (sales_strategy may be a dict) yield None, so one such
+    product cannot break the cached catalog load.
+    """
+    return text.strip().split(".")[0] if text and isinstance(text, str) else None
+
+_DIGI_OPTION_KEYS = {
+    "meeting": "Meeting and Event Planner Digital ads",
+    "tour": "Tourism Digital ads",
+    "local": "Local Digital ads",
+}
+_DIGI_DEFAULT = (
+    "Ateema’s digital advertising programs extend your reach beyond print, "
+    "concierge, and event-based channels, keeping your business visible "
+    "when people are actively deciding where to go and what to book."
+)
+
+def _digi_leads(meta: Dict[str, dict]) -> Dict[str, str]:
+    """Lead paragraph per audience: option note, else product description, else the default."""
+    digi_meta = meta.get("Digital Advertisement") or {}
+    notes_map = digi_meta.get("notes_map") or {}
+    product_desc = digi_meta.get("product_description") or ""
+    return {
+        aud: notes_map.get(key, "") or product_desc or _DIGI_DEFAULT
+        for aud, key in _DIGI_OPTION_KEYS.items()
+    }
+
+@st.cache_data(show_spinner=False)
+def _load_catalog(folder_str: str, mtime_sig: tuple):
+    """load_products, re-run only when mtime_sig changes (failures are not cached).
+
+    Also stores the first-clause cue text make_reasoning uses on each meta entry,
+    and returns the sorted product names for the candidate picker and the
+    digital-ads lead text.
+    """
+    catalog, meta = load_products(Path(folder_str))
+    for info in meta.values():
+        info["_desc_first"] = _first_clause(info.get("product_description", ""))
+        info["_strategy_first"] = _first_clause(info.get("sales_strategy", ""))
+        info["_notes_first_by_opt"] = {
+            opt: _first_clause(note) for opt, note in info.get("option_notes", {}).items()
+        }
+    return catalog, meta, tuple(sorted(catalog)), _digi_leads(meta)
+
+@st.cache_data(show_spinner=False)
+def _parse_input_json(path_str: str, mtime_ns: int) -> dict:
+    """Input payload plus the focus/target/audience pulled from its profile; mtime_ns is the cache key."""
+    raw = read_json(path_str)
+    profile = raw.get("client_profile", "")
+
+    # Extract focus/target/audience from profile for reasoning
+    focus_match = _FOCUS_RE.search(profile)
+    target_match = _TARGET_RE.search(profile)
+    audience_match = _AUDIENCE_RE.search(profile)
+
+    return {
+        "profile": profile,
+        "budget": float(raw.get("budget", 0)),
+        "similar_clients": raw.get("similar_clients", []),
+        "chosen": list(raw.get("candidate_products", [])),
+        "focus": focus_match.group(1).strip() if focus_match else "",
+        "market": target_match.group(1).strip() if target_match else "",
+        "audience": audience_match.group(1).strip() if audience_match else "",
+    }
+
 def qty_from_tier(tier: str) -> int:
     if not tier:
         return 1
-    m = re.fullmatch(r"(\d+)\s*[xX]", tier.strip())
-    return int(m.group(1)) if m else 1
+    # "<digits><spaces>x" (e.g. "5x", "3 X"), parsed without the regex engine
+    t = tier.strip()
+    if t[-1:] not in ("x", "X"):
+        return 1
+    head = t[:-1].rstrip()
+    return int(head) if head.isdecimal() else 1
 
 def make_reasoning(
-    product: str,
-    option: str,
-    tier: str,
-    label: str,
-    focus: str,
-    market_target: str,
+    focus_bullet: str,
+    target_bullet: str,
+    notes_first: str | None,
+    desc_first: str | None,
+    strategy_first: str | None,
 ) -> str:
     """
     Produce 2–4 short bullet-point style phrases.
     Clean, scannable, cue-card style.
-    """
-
-    info = meta.get(product, {})
-    desc = info.get("product_description", "")
-    strategy = info.get("sales_strategy", "")
-    notes = info.get("option_notes", {}).get(option, "")
-
-    bullets = []
-
-    # 1) Focus + Target — compressed to short phrase
-    bullets.append(
-        f"Supports {focus.lower()}"
-    )
-    bullets.append(
-        f"Reaches {market_target.lower()}"
-    )
-
-    # 2) Option-level advantage — shorten aggressively
-    if notes:
-        short_notes = notes.strip().split(".")[0]
-        bullets.append(short_notes)
-
-    # 3) Product description — only most essential clause
-    if desc:
-        first_clause = desc.strip().split(".")[0]
-        bullets.append(first_clause)
 
-    # 4) Strategy — also shortened
-    if strategy:
-        short_strategy = strategy.strip().split(".")[0]
-        bullets.append(short_strategy)
-
-    # Keep only first 3–4 bullets
-    bullets = bullets[:4]
-
-    # Format as bullet-point phrases separated by semicolons
-    reasoning = "; ".join(bullets)
-
-    return reasoning
+    Focus/target bullets are built once per pool by rows_from_selection; the
+    option note, description and strategy clauses come precomputed from
+    _load_catalog (None = no text).
+    """
+    # Focus + target, then up to two of note / description / strategy
+    extras = [b for b in (notes_first, desc_first, strategy_first) if b is not None]
+    return "; ".join([focus_bullet, target_bullet, *extras[:2]])
 
 
 def rows_from_selection(
@@ -138,18 +215,28 @@ def rows_from_selection(
     all_products: set[str],
     prepay_full_year: bool,
     is_advertiser: bool, # Dazhou 11/17 Advertiser
-) -> List[Dict]:
+    meta_subset: Dict[str, dict],
+) -> Dict[str, list]:
     """
-    Build table rows for a pool, applying product-specific discounts.
+    Build table columns for a pool, applying product-specific discounts.
+
+    Returns column lists (one entry per pick); line totals are left to the
+    caller so they can be computed column-wise.
 
     - unit_price_original: pre-discount unit price from allocator
     - unit_price: discounted unit price (may be same as original)
     """
-    out: List[Dict] = []
+    products, options, qtys, up_orig, up_disc, discounts, reasonings = [], [], [], [], [], [], []
+
+    n_products = len(all_products)
+    # identical for every pick in the pool
+    focus_bullet = f"Supports {focus.lower()}"
+    target_bullet = f"Reaches {market_target.lower()}"
 
     for prod, (opt_name, tier, unit_price_original) in sel.picks.items():
         qty = qty_from_tier(tier)
-        has_other_products = len(all_products - {prod}) > 0
+        # same as len(all_products - {prod}) > 0, without building a set per pick
+        has_other_products = n_products > (1 if prod in all_products else 0)
 
         # Phase 1 discount engine
         unit_price_discounted, discount_label = apply_discounts(
@@ -162,26 +249,32 @@ def rows_from_selection(
             is_advertiser=is_advertiser, # Dazhou 11/17 Advertiser
         )
 
-        line_total_original = unit_price_original * qty
-        line_total = unit_price_discounted * qty
-
-        reasoning = make_reasoning(prod, opt_name, tier, label, focus, market_target)
-
-        out.append(
-            {
-                "product": prod,
-                "option": opt_name,
-                "qty": qty,
-                "unit_price_original": unit_price_original,
-                "unit_price": unit_price_discounted,
-                "discount": discount_label or "",
-                "total_price_original": line_total_original,
-                "total_price": line_total,
-                "reasoning": reasoning,
-            }
+        info = meta_subset.get(prod, {})
+        reasoning = make_reasoning(
+            focus_bullet,
+            target_bullet,
+            info.get("_notes_first_by_opt", {}).get(opt_name),
+            info.get("_desc_first"),
+            info.get("_strategy_first"),
         )
 
-    return out
+        products.append(prod)
+        options.append(opt_name)
+        qtys.append(qty)
+        up_orig.append(unit_price_original)
+        up_disc.append(unit_price_discounted)
+        discounts.append(discount_label or "")
+        reasonings.append(reasoning)
+
+    return {
+        "product": products,
+        "option": options,
+        "qty": qtys,
+        "unit_price_original": up_orig,
+        "unit_price": up_disc,
+        "discount": discounts,
+        "reasoning": reasonings,
+    }
 
 
 # ---------- Load products ----------
@@ -190,7 +283,8 @@ if not folder.exists():
     st.error(f"Folder not found: {products_path}")
     st.stop()
 
-found = list_jsons(folder)
+folder_sig = _mtime_sig(folder)
+found = list_jsons(str(folder), folder_sig)
 if not found:
     st.warning("No *.json files found in the selected folder.")
 else:
@@ -200,24 +294,28 @@ else:
 
 catalog = {}
 meta = {}
+all_names = ()
+digi_leads = _digi_leads({})
 try:
-    catalog, meta = load_products(folder)
+    catalog, meta, all_names, digi_leads = _load_catalog(str(folder), folder_sig)
 except Exception as e:
     bad = None
-    for p in folder.glob("*.json"):
-        try:
-            _ = json.loads(Path(p).read_text(encoding="utf-8"))
-        except Exception as sub_e:
-            bad = (str(p), str(sub_e))
-            break
+    # Parse files on a small thread pool; results come back in file order, so
+    # the first bad file reported is the same one a sequential scan would find.
+    ex = ThreadPoolExecutor(max_workers=min(16, len(found) or 1))
+    try:
+        for p, err in zip(found, ex.map(_try_parse, found)):
+            if err is not None:
+                bad = (p, err)
+                break
+    finally:
+        ex.shutdown(wait=False, cancel_futures=True)
     if bad:
         st.error(f"Failed to load. Problem file: {bad[0]} — {bad[1]}")
     else:
         st.error(f"Failed to load products: {e}")
     st.stop()
 
-all_names = sorted(catalog.keys())
-
 # ---------- Input areas ----------
 profile_text = ""
 focus_text = ""
@@ -235,22 +333,14 @@ if input_mode == "Load JSON":
     st.subheader("Load JSON")
     json_path = st.text_input("Input JSON path", value=str(Path(folder.parent, "Inputs", "input.json")))
     if st.button("Generate Proposal", type="primary", key="gen_from_json"):
-        raw = json.loads(Path(json_path).read_text(encoding="utf-8"))
-        profile = raw.get("client_profile", "")
-        total_budget = float(raw.get("budget", 0))
-        similar_clients = raw.get("similar_clients", [])
-        chosen = list(raw.get("candidate_products", []))
-
-        # Extract focus/target/audience from profile for reasoning
-        focus_match = re.search(r"Focus:\s*(.*)", profile, re.IGNORECASE)
-        target_match = re.search(r"Market Target:\s*(.*)", profile, re.IGNORECASE)
-        audience_match = re.search(r"Audience Type:\s*(.*)", profile, re.IGNORECASE)
-
-        focus_text = focus_match.group(1).strip() if focus_match else ""
-        market_text = target_match.group(1).strip() if target_match else ""
-        audience_type_text = audience_match.group(1).strip() if audience_match else ""
-
-        profile_text = profile
+        parsed = _parse_input_json(json_path, os.stat(json_path).st_mtime_ns)
+        total_budget = parsed["budget"]
+        similar_clients = parsed["similar_clients"]
+        chosen = parsed["chosen"]
+        focus_text = parsed["focus"]
+        market_text = parsed["market"]
+        audience_type_text = parsed["audience"]
+        profile_text = parsed["profile"]
 
         st.session_state["_trigger_generate"] = True
         st.session_state["_payload_similar"] = similar_clients
@@ -303,12 +393,13 @@ else:
         "Focus (what outcome?)",
         value="Launch seasonal tasting menu; boost lunch & pre-theatre reservations",
         height=80,
-    )
+    ).strip()
     market_text = st.text_area(
         "Market Target (who to reach?)",
         value="Downtown professionals; tourists near River North theatres",
         height=80,
-    )
+    ).strip()
+    # stripped once here; the JSON branch strips its regex matches the same way
 
 
     is_advertiser = st.checkbox("Existing Advertiser?", value=True)
@@ -354,7 +445,7 @@ else:
                 picked = set(chosen)
                 for d in sc["similar_clients"]:
                     for p in d.get("purchased", []):
-                        if p in all_names:
+                        if p in catalog:
                             picked.add(p)
                 chosen = st.multiselect("Choose candidate products", options=all_names, default=sorted(picked))
         except Exception as e:
@@ -363,14 +454,14 @@ else:
     # Candidate products – start EMPTY
     chosen = st.multiselect("Choose candidate products", options=all_names, default=[])
 
-    profile_text = (
-        f"Business Name: {business_name}\n"
-        f"Business Type: {business_type}\n"
-        f"Matched Summit Award: {matched_award if matched_award else 'None'}\n"
-        f"Audience Type: {audience_type_text}\n"
-        f"Focus: {focus_text}\n"
-        f"Market Target: {market_text}"
-    )
+    profile_text = "\n".join((
+        f"Business Name: {business_name}",
+        f"Business Type: {business_type}",
+        f"Matched Summit Award: {matched_award or 'None'}",
+        f"Audience Type: {audience_type_text}",
+        f"Focus: {focus_text}",
+        f"Market Target: {market_text}",
+    ))
 
 
     if st.button("Generate Proposal", type="primary", key="gen_from_survey"):
@@ -380,61 +471,51 @@ else:
 def make_digital_ads_paragraph(audience_type: str,
                                focus: str,
                                market_target: str,
-                               meta: Dict[str, dict]) -> str:
+                               digi: Dict[str, str]) -> str:
     """
     Build a short reasoning paragraph for Digital Advertising, using
     Additional Digital Advertisement.json as context plus client info.
     Always-on: we call this for every proposal.
+    `focus` and `market_target` are expected already stripped; `digi` is
+    the per-audience lead text from _digi_leads.
     """
-    digi_meta = meta.get("Digital Advertisement") or {}
-    notes_map = digi_meta.get("notes_map") or {}
-    product_desc = digi_meta.get("product_description") or ""
-
     at = (audience_type or "").lower()
 
     if "meeting" in at or "planner" in at:
-        key = "Meeting and Event Planner Digital ads"
+        lead = digi["meeting"]
     elif "tour" in at:
-        key = "Tourism Digital ads"
+        lead = digi["tour"]
     else:
-        key = "Local Digital ads"
+        lead = digi["local"]
 
-    opt_note = notes_map.get(key, "")
-
-    parts = []
-    parts.append("**Digital Advertising Recommendation**")
-
-    if opt_note:
-        parts.append(opt_note)
-    elif product_desc:
-        parts.append(product_desc)
-    else:
-        parts.append(
-            "Ateema’s digital advertising programs extend your reach beyond print, "
-            "concierge, and event-based channels, keeping your business visible "
-            "when people are actively deciding where to go and what to book."
-        )
+    parts = ["**Digital Advertising Recommendation**", lead]
 
     if focus:
         parts.append(
-            f"This directly supports your focus on _{focus.strip()}_ by adding "
+            f"This directly supports your focus on _{focus}_ by adding "
             "measurable, always-on visibility in digital channels."
         )
 
     if market_target:
         parts.append(
             f"It is especially effective for reaching your target audience: "
-            f"_{market_target.strip()}_."
+            f"_{market_target}_."
         )
 
     return "\n\n".join(parts)
 
 
-# Dazhou 11/17 Advertiser
-def _render_table(label: str, sel, all_products: set[str], prepay_full_year: bool, is_advertiser: bool): # Dazhou 11/17 Advertiser
-    import pandas as pd
+_TABLE_COLUMNS = {
+    "unit_price_original": st.column_config.NumberColumn("unit_price_original", format="$%.2f"),
+    "unit_price": st.column_config.NumberColumn("unit_price", format="$%.2f"),
+    "total_price_original": st.column_config.NumberColumn("total_price_original", format="$%.2f"),
+    "total_price": st.column_config.NumberColumn("total_price", format="$%.2f"),
+    "reasoning": st.column_config.TextColumn("reasoning", width="large"),
+}
 
-    rows = rows_from_selection(
+# Dazhou 11/17 Advertiser
+def _render_table(label: str, sel, all_products: set[str], prepay_full_year: bool, is_advertiser: bool, meta_subset: Dict[str, dict]): # Dazhou 11/17 Advertiser
+    cols = rows_from_selection(
         label=label,
         sel=sel,
         focus=focus_text,
@@ -442,34 +523,30 @@ def _render_table(label: str, sel, all_products: set[str], prepay_full_year: boo
         all_products=all_products,
         prepay_full_year=prepay_full_year,
         is_advertiser=is_advertiser, # Dazhou 11/17 Advertiser
+        meta_subset=meta_subset,
     )
-    if rows:
+    if cols["product"]:
         st.write(f"**Subtotal (before discounts):** ${sel.subtotal:,.0f}")
+        qty = np.asarray(cols["qty"], dtype=np.int64)
+        up_orig = np.asarray(cols["unit_price_original"], dtype=np.float64)
+        up_disc = np.asarray(cols["unit_price"], dtype=np.float64)
+        # Typed columns: pandas takes the arrays as-is instead of inferring per row
         df = pd.DataFrame(
-            rows,
-            columns=[
-                "product",
-                "option",
-                "qty",
-                "unit_price_original",
-                "unit_price",
-                "discount",
-                "total_price_original",
-                "total_price",
-                "reasoning",
-            ],
-        )
-        st.markdown(
-            """
-            <style>
-            table { table-layout: fixed; width: 100%; border-collapse: collapse; }
-            thead th { font-weight: 700; font-size: 16px !important; text-align: left; padding: 6px; }
-            td { white-space: normal !important; word-wrap: break-word !important; font-size: 15px; vertical-align: top; padding: 6px; }
-            </style>
-            """,
-            unsafe_allow_html=True,
+            {
+                "product": cols["product"],
+                "option": cols["option"],
+                "qty": qty,
+                "unit_price_original": up_orig,
+                "unit_price": up_disc,
+                "discount": cols["discount"],
+                "total_price_original": up_orig * qty,
+                "total_price": up_disc * qty,
+                "reasoning": cols["reasoning"],
+            },
+            copy=False,
         )
-        st.table(df)
+        # Data grid instead of a static HTML table: only data is sent, rows render client-side
+        st.dataframe(df, use_container_width=True, column_config=_TABLE_COLUMNS)
     else:
         st.info("No items selected.")
 # ---------- Generation ----------
@@ -482,29 +559,31 @@ if st.session_state.get("_trigger_generate"):
     subset = {k: catalog[k] for k in chosen if k in catalog}
     subset = apply_summit_rules(subset, profile_text=profile_text, is_advertiser=is_advertiser)
 
-    t_set, i_set = partition_by_category(subset, {k: meta.get(k, {}) for k in subset.keys()})
-    t_sel, i_sel, grand_total = run_fill_to_cap(total_budget, tourist_pct, industry_pct, t_set, i_set, meta, billing_date, is_advertiser=is_advertiser,)
+    # built once; shared by partitioning, the allocator, reasoning rows and the preview
+    meta_subset = {k: meta.get(k, {}) for k in subset}
+    t_set, i_set = partition_by_category(subset, meta_subset)
+    t_sel, i_sel, grand_total = run_fill_to_cap(total_budget, tourist_pct, industry_pct, t_set, i_set, meta_subset, billing_date, is_advertiser=is_advertiser,)
 
     # set of all selected products (used for bundle discounts)
     all_products = set(t_sel.picks.keys()) | set(i_sel.picks.keys())
 
     # header ...
     st.subheader("Tourist Pool")
-    _render_table("tourist", t_sel, all_products, prepay_full_year, is_advertiser) # Dazhou 11/17 Advertiser
+    _render_table("tourist", t_sel, all_products, prepay_full_year, is_advertiser, meta_subset) # Dazhou 11/17 Advertiser
     st.markdown("---")
     st.markdown("---")
     st.subheader("Industry Pool")
-    _render_table("industry", i_sel, all_products, prepay_full_year, is_advertiser) # Dazhou 11/17 Advertiser
+    _render_table("industry", i_sel, all_products, prepay_full_year, is_advertiser, meta_subset) # Dazhou 11/17 Advertiser
 
     st.markdown("---")
     st.markdown(f"### Grand Total: ${grand_total:,.0f} (Hard cap = ${total_budget*1.10:,.0f})")
 
     with st.expander("Allocator input preview"):
-        st.code(format_product_block(subset, {k: meta.get(k, {}) for k in subset.keys()}))
+        st.code(format_product_block(subset, meta_subset))
 
     # --- Always-on Digital Ads recommendation (below allocator preview) ---
     try:
-        digi_text = make_digital_ads_paragraph(audience_type_text, focus_text, market_text, meta)
+        digi_text = make_digital_ads_paragraph(audience_type_text, focus_text, market_text, digi_leads)
         if digi_text:
             st.markdown("---")
             st.markdown(digi_text)